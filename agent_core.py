@@ -0,0 +1,910 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LangGraph Agent Core
+
+The tool-using agent shared by code5withtools.py and code6toolsreasoning.py.
+Both scripts run the same graph; with reasoning enabled (code6), the agent
+also explains how it arrived at each answer and records its steps in a
+reasoning log that the user can show with 'debug on'.
+"""
+
+import os
+import sys
+import json
+import uuid
+import asyncio
+import threading
+import datetime
+import math
+import ast
+import operator
+import random
+import aiosqlite
+import httpx
+from functools import lru_cache, partial
+from collections import OrderedDict, deque
+from typing import Annotated, Deque, Dict, Any, List, Literal, Optional, Set, Tuple, TypedDict
+from dotenv import load_dotenv
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph import StateGraph, END
+
+# Load environment variables from .env file (for API keys)
+load_dotenv()
+
+# Read the API key once at import and fail fast if it is missing, before any
+# client or graph is built.
+API_KEY = os.getenv("OPENAI_API_KEY")
+if not API_KEY:
+    sys.exit("Error: OPENAI_API_KEY not found in environment variables.\n"
+             "Please set it in a .env file or export it to your environment.")
+
+# Initialize the async OpenAI client. A shared httpx client keeps connections
+# alive across calls instead of re-handshaking for every request.
+import openai
+client = openai.AsyncOpenAI(
+    api_key=API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=32),
+        timeout=60,
+    ),
+)
+
+
+# Math functions and constants the calculator may use, built once at import
+ALLOWED_NAMES = {
+    k: v for k, v in math.__dict__.items()
+    if not k.startswith('__')
+}
+
+
+# Arithmetic operators the calculator supports
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+@lru_cache(maxsize=512)
+def parse_expression(expression: str) -> ast.expr:
+    """
+    Parse an expression into its syntax tree. Repeated expressions reuse the tree.
+    """
+    return ast.parse(expression, mode="eval").body
+
+
+def evaluate(node: ast.expr) -> Any:
+    """
+    Evaluate a parsed arithmetic expression.
+    
+    Only numbers, the operators in OPERATORS and the names in ALLOWED_NAMES
+    are accepted, so unlike eval() this cannot run arbitrary code.
+    
+    Args:
+        node: A node of the parsed expression
+        
+    Returns:
+        The value of the expression
+    """
+    node_type = type(node)
+    
+    if node_type is ast.Constant and type(node.value) in (int, float, complex):
+        return node.value
+    if node_type is ast.BinOp and type(node.op) in OPERATORS:
+        return OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right))
+    if node_type is ast.UnaryOp and type(node.op) in OPERATORS:
+        return OPERATORS[type(node.op)](evaluate(node.operand))
+    if node_type is ast.Name and node.id in ALLOWED_NAMES:
+        return ALLOWED_NAMES[node.id]
+    if (node_type is ast.Call and type(node.func) is ast.Name
+            and node.func.id in ALLOWED_NAMES and not node.keywords):
+        return ALLOWED_NAMES[node.func.id](*[evaluate(arg) for arg in node.args])
+    
+    raise ValueError(f"unsupported expression '{ast.unparse(node)}'")
+
+
+# Define tools that our agent can use
+def calculator(expression: str) -> str:
+    """
+    Evaluate a mathematical expression.
+    
+    Args:
+        expression: A string containing a mathematical expression
+        
+    Returns:
+        The result of the calculation
+    """
+    try:
+        # Walk the parsed expression instead of eval()-ing it
+        result = evaluate(parse_expression(expression))
+        return f"Result of {expression} = {result}"
+    except Exception as e:
+        return f"Error evaluating expression: {str(e)}"
+
+
+def get_current_time() -> str:
+    """
+    Get the current date and time.
+    
+    Returns:
+        A string with the current date and time
+    """
+    # Same "YYYY-MM-DD HH:MM:SS" text as strftime, without parsing a format string
+    return f"Current time: {datetime.datetime.now().isoformat(' ', 'seconds')}"
+
+
+# Possible conditions and temperatures for the simulated weather, built once
+WEATHERS = ("sunny", "cloudy", "rainy", "snowy", "windy")
+TEMPS = tuple(range(0, 35))
+
+
+def get_weather(location: str) -> str:
+    """
+    Get the weather for a location (simulated).
+    
+    Args:
+        location: City or location to get weather for
+        
+    Returns:
+        Weather information for the specified location
+    """
+    # This is a mock implementation - in a real app, you would call a weather API
+    weather = random.choice(WEATHERS)
+    temp = random.choice(TEMPS)
+    
+    return f"Weather in {location}: {weather} with a temperature of {temp}°C"
+
+
+# Tool dispatch table: name -> (function, required argument names, deterministic).
+# A deterministic tool's result is already a user-ready answer, so it is shown
+# as is instead of being paraphrased by another model call.
+TOOLS = {
+    "calculator": (calculator, ("expression",), True),
+    "get_current_time": (get_current_time, (), True),
+    "get_weather": (get_weather, ("location",), False),
+}
+
+
+# JSON Schema descriptions of the tools, sent with each request so the model
+# can call them through OpenAI's native tool calling
+TOOL_SCHEMAS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "calculator",
+            "description": "Evaluate a mathematical expression, e.g. '25 * 16'.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "expression": {"type": "string", "description": "The expression to evaluate"},
+                },
+                "required": ["expression"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_current_time",
+            "description": "Get the current date and time.",
+            "parameters": {"type": "object", "properties": {}},
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "description": "Check the weather for a location, e.g. 'Paris'.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "location": {"type": "string", "description": "City or location to check"},
+                },
+                "required": ["location"],
+            },
+        },
+    },
+]
+
+
+# SQLite database holding the chat's conversation checkpoints, and the
+# conversation (thread) to continue. Use a different CHAT_THREAD_ID per user or session.
+# The two agents share the database but never a conversation: the thread id
+# is suffixed with the agent's kind (see chat_thread_id), since each agent
+# has its own system prompt and answer format.
+CHAT_DB_PATH = "agent_state.db"
+THREAD_ID = os.getenv("CHAT_THREAD_ID", "repl")
+
+
+def chat_thread_id(with_reasoning: bool) -> str:
+    """Return the interactive chat's thread id for the given kind of agent."""
+    return f"{THREAD_ID}-{'reasoning' if with_reasoning else 'tools'}"
+
+
+# Once the history grows past this many messages, everything before the last
+# WINDOW or so messages is folded into a single summary message. This bounds
+# the stored state and the prompt sent on each turn, while compacting rarely
+# enough that the prompt prefix stays stable between compactions.
+WINDOW = 12
+SUMMARY_THRESHOLD = 40
+SUMMARY_INSTRUCTIONS = ("Summarize the following conversation in 200 tokens or fewer, "
+                        "preserving names, dates, user preferences and tool results.")
+
+
+# Models for the two kinds of agent call. Choosing a tool (or answering a
+# simple message directly) is easy and runs on every turn, so it uses a small,
+# fast model; the larger model only writes answers from tool results.
+DECIDE_MODEL = "gpt-4o-mini"
+RESPOND_MODEL = "gpt-4o"
+
+# System message shared by every call. It is built once at import and kept
+# constant so OpenAI's automatic prompt caching can reuse the common prefix
+# (system message, tool schemas and the earlier history) across turns.
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are a helpful, friendly assistant that can use tools to assist the user.",
+}
+
+# System message for the agent that explains its answers. Its final answers
+# are requested in JSON mode, so they parse with a single json.loads.
+REASONING_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": ("You are a helpful, friendly assistant that can use tools to assist the user. "
+                "When you answer the user, respond in JSON with keys: reasoning, response. "
+                "'reasoning' briefly explains how you arrived at your answer and 'response' is "
+                "your actual response to the user. Make your reasoning insightful but concise."),
+}
+
+
+# Response caching. Model outputs are cached exactly on the whole history
+# the model sees: the earlier conversation, the user's message and any tool
+# calls and results so far. A message like "what's my name?" therefore only
+# reuses an answer given in the same context, never another conversation's,
+# and a tool that returned something new (e.g. a later time) never hits.
+# Direct answers to the first message of a conversation are also cached
+# semantically, so a paraphrased repeat of a question reuses the earlier
+# answer when the two messages' embeddings are close enough; later messages
+# depend on their context and are not. Entries are kept apart for the plain
+# and the reasoning agent, whose answers differ in format, and the least
+# recently used entries are dropped once a cache is full.
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_THRESHOLD = 0.88
+TURN_CACHE_SIZE = 1024
+SEMANTIC_CACHE_SIZE = 256
+turn_cache: "OrderedDict[Tuple[bool, str], Dict[str, Any]]" = OrderedDict()
+semantic_cache: Deque[Tuple[bool, List[float], str]] = deque(maxlen=SEMANTIC_CACHE_SIZE)
+
+# Embeddings for the semantic cache are stored in the background; keep a
+# reference to each task until it is done so it isn't garbage collected
+background_tasks: Set[asyncio.Task] = set()
+
+
+def turn_key(turn: List[Dict[str, Any]]) -> str:
+    """
+    Build the exact-match cache key for the messages the model sees.
+    
+    Tool call IDs differ between otherwise identical calls, so they are left out.
+    """
+    return json.dumps([
+        {
+            "role": message["role"],
+            "content": message["content"],
+            "tool_calls": [tool_call["function"] for tool_call in message.get("tool_calls", [])],
+        }
+        for message in turn
+    ], sort_keys=True)
+
+
+async def embed(text: str) -> List[float]:
+    """
+    Embed a message and normalize it to unit length, so that a dot product
+    between two embeddings is their cosine similarity.
+    """
+    response = await client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    vector = response.data[0].embedding
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+async def remember_answer(question: str, answer: str, with_reasoning: bool):
+    """
+    Add a direct answer to the semantic cache.
+    
+    This runs after the answer is shown, and an embeddings error only means
+    the answer isn't cached.
+    """
+    try:
+        vector = await embed(question)
+    except Exception:
+        return
+    semantic_cache.append((with_reasoning, vector, answer))
+
+
+def semantic_lookup(vector: List[float], with_reasoning: bool) -> Optional[str]:
+    """
+    Return the cached answer whose question is most similar to this one,
+    if it is at least SEMANTIC_CACHE_THRESHOLD similar.
+    """
+    best_score, best_answer = 0.0, None
+    for cached_with_reasoning, cached_vector, answer in semantic_cache:
+        if cached_with_reasoning != with_reasoning:
+            continue
+        score = sum(a * b for a, b in zip(vector, cached_vector))
+        if score > best_score:
+            best_score, best_answer = score, answer
+    return best_answer if best_score >= SEMANTIC_CACHE_THRESHOLD else None
+
+
+# Define states and functions for our agent
+def merge_history(history: List[Dict[str, Any]], update: Any) -> List[Dict[str, Any]]:
+    """
+    Reducer for the conversation history.
+    
+    A list of messages is appended to the history; a {"replace": messages}
+    dict replaces it, which is how compacted history is stored. Appending
+    builds a new list rather than extending the stored one, because earlier
+    checkpoints still refer to that list.
+    """
+    if isinstance(update, dict):
+        return update["replace"]
+    return history + update
+
+
+class AgentState(TypedDict):
+    """
+    State passed between the nodes of the agent graph.
+    
+    Nodes return only the messages they add, and the merge_history reducer
+    appends them to the stored history, so no node copies the history or
+    shares its list with an earlier turn. The reducer itself builds one new
+    list per update, which is linear in the history length; compaction keeps
+    that history short. The reasoning log covers the current turn only and is only
+    filled in debug mode, so its messages are not built when nobody reads them.
+    """
+    history: Annotated[List[Dict[str, Any]], merge_history]
+    reasoning_log: List[str]
+    input: str
+    response: str
+    tool_result: str
+    stream: bool
+    debug: bool
+
+
+def process_input(state: AgentState) -> Dict[str, Any]:
+    """
+    Process user input and add it to conversation history.
+    """
+    user_input = state["input"]
+    
+    # Add user message to history and start this turn's reasoning log
+    return {
+        "history": [{"role": "user", "content": user_input}],
+        "reasoning_log": [f"📝 Received user input: \"{user_input}\""] if state["debug"] else [],
+    }
+
+
+async def compact_history(state: AgentState) -> Dict[str, Any]:
+    """
+    Replace older conversation history with a short summary.
+    
+    The recent part starts at a user message, so no tool result is separated
+    from the assistant message that requested it.
+    """
+    history = state["history"]
+    split = next(i for i in range(len(history) - WINDOW, len(history)) if history[i]["role"] == "user")
+    older, recent = history[:split], history[split:]
+    
+    # Send the older turns as a plain transcript so the model summarizes them
+    # rather than replying to the last message
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in older if message["content"])
+    
+    try:
+        response = await client.chat.completions.create(
+            model=DECIDE_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": transcript},
+            ],
+            max_tokens=300,
+        )
+        summary = response.choices[0].message.content.strip()
+    except Exception:
+        # Keep the full history if summarization fails; compaction is retried
+        # on the next turn
+        return {}
+    
+    update = {"history": {"replace": [{"role": "system", "content": f"Summary so far: {summary}"}, *recent]}}
+    if state["debug"]:
+        update["reasoning_log"] = [*state["reasoning_log"], f"🗜️ Summarized {len(older)} older messages"]
+    return update
+
+
+async def agent(state: AgentState, with_reasoning: bool) -> Dict[str, Any]:
+    """
+    Call the model once; it either requests tools or answers the user.
+    In debug mode, record each step in the reasoning log.
+    
+    The tool schemas are passed with the request, so a single completion
+    either asks for tools or is already the final response. After the tools
+    have run, this node is called again with their results in the history.
+    """
+    history = state["history"]
+    reasoning_log = state["reasoning_log"].copy()
+    log = reasoning_log.append
+    debug = state["debug"]
+    
+    # The current turn is the latest user message and anything after it. The
+    # cache key covers the earlier history too, since the answer depends on it.
+    turn_start = max(i for i, message in enumerate(history) if message["role"] == "user")
+    key = (with_reasoning, turn_key(history))
+    first_call = turn_start == len(history) - 1
+    
+    # Only a conversation's first message has no context, so only its direct
+    # answer can be shared with a similar question
+    semantic = first_call and turn_start == 0
+    
+    # Add to reasoning log
+    if debug:
+        if first_call:
+            log(f"🤔 Analyzing what to do with: \"{history[-1]['content']}\"")
+        else:
+            log("📝 Generating response based on tool result")
+    
+    # Reuse an earlier output for this exact turn, or a direct answer to a
+    # similar question, before calling the API
+    output = turn_cache.get(key)
+    if output is not None:
+        turn_cache.move_to_end(key)
+    elif semantic and any(cached[0] == with_reasoning for cached in semantic_cache):
+        # The question is only embedded when there is something it could
+        # match, and an embeddings error just means no semantic hit
+        try:
+            vector = await embed(history[-1]["content"])
+        except Exception:
+            vector = None
+        answer = semantic_lookup(vector, with_reasoning) if vector is not None else None
+        if answer is not None:
+            output = {"content": answer, "tool_calls": []}
+    
+    if output is None:
+        # Static system message first, then the full history (including
+        # earlier tool calls and results), so each turn's prompt extends the
+        # previous one and its prefix stays byte-identical
+        system_message = REASONING_SYSTEM_MESSAGE if with_reasoning else SYSTEM_MESSAGE
+        messages = [system_message, *history]
+        
+        # The reasoning agent answers in JSON mode, so its reply always
+        # parses into its reasoning and its response
+        extra = {"response_format": {"type": "json_object"}} if with_reasoning else {}
+        
+        # Let the model pick tools itself, streaming the reply so any answer
+        # text can be shown as soon as it arrives
+        stream = await client.chat.completions.create(
+            model=DECIDE_MODEL if first_call else RESPOND_MODEL,
+            messages=messages,
+            tools=TOOL_SCHEMAS,
+            tool_choice="auto",
+            stream=True,
+            **extra,
+        )
+        chunks = []
+        tool_calls = {}
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                if state["stream"]:
+                    print(delta.content, end="", flush=True)
+                chunks.append(delta.content)
+            
+            # Tool calls arrive in pieces; join them up by their index
+            for tool_call in delta.tool_calls or []:
+                function = tool_calls.setdefault(tool_call.index, {"name": "", "arguments": ""})
+                function["name"] += tool_call.function.name or ""
+                function["arguments"] += tool_call.function.arguments or ""
+        
+        output = {
+            "content": "".join(chunks),
+            "tool_calls": [tool_calls[index] for index in sorted(tool_calls)],
+        }
+        
+        turn_cache[key] = output
+        if len(turn_cache) > TURN_CACHE_SIZE:
+            turn_cache.popitem(last=False)
+        if semantic and not output["tool_calls"]:
+            task = asyncio.create_task(remember_answer(history[-1]["content"], output["content"], with_reasoning))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+    else:
+        if debug:
+            log("⚡ Reusing a cached model output instead of calling the API")
+        if state["stream"] and not output["tool_calls"]:
+            # Show a cached answer the same way a streamed one would appear
+            print(output["content"], end="", flush=True)
+    
+    if output["tool_calls"]:
+        if debug:
+            for function in output["tool_calls"]:
+                log(f"🔧 Decided to use tool: {function['name']} with args: {function['arguments']}")
+        
+        # Record the tool request; use_tool answers each call in the history
+        return {"reasoning_log": reasoning_log, "history": [{
+            "role": "assistant",
+            "content": output["content"],
+            "tool_calls": [
+                {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function", "function": dict(function)}
+                for function in output["tool_calls"]
+            ],
+        }]}
+    
+    # No tool needed: this completion is the final response
+    assistant_message = output["content"].strip()
+    
+    if debug and first_call:
+        log("💬 Decided to respond directly without using a tool")
+    
+    if with_reasoning:
+        # Split the JSON answer into its reasoning and response
+        try:
+            answer = json.loads(assistant_message)
+        except json.JSONDecodeError:
+            answer = None
+        
+        # If the answer wasn't valid JSON, the whole message is the response
+        if isinstance(answer, dict) and "response" in answer:
+            if debug:
+                log(f"💭 Final reasoning: {str(answer.get('reasoning', '')).strip()}")
+            assistant_message = str(answer["response"]).strip()
+    
+    if debug:
+        log(f"🤖 Final response: {assistant_message}")
+    
+    # Add the response to state and history
+    return {
+        "response": assistant_message,
+        "reasoning_log": reasoning_log,
+        "history": [{"role": "assistant", "content": assistant_message}],
+    }
+
+
+def use_tool(state: AgentState) -> Dict[str, Any]:
+    """
+    Execute the tools the model requested and capture the results.
+    
+    When every requested tool is deterministic and succeeded, the results are
+    the final response and the second model call is skipped.
+    """
+    reasoning_log = state["reasoning_log"].copy()
+    log = reasoning_log.append
+    debug = state["debug"]
+    tool_messages = []
+    results = []
+    deterministic = True
+    for tool_call in state["history"][-1]["tool_calls"]:
+        tool_name = tool_call["function"]["name"]
+        try:
+            tool_args = json.loads(tool_call["function"]["arguments"] or "{}")
+        except json.JSONDecodeError:
+            tool_args = {}
+            if debug:
+                log("⚠️ Couldn't parse tool arguments")
+        
+        # Execute the requested tool
+        fn, required, is_deterministic = TOOLS.get(tool_name, (None, None, False))
+        deterministic = deterministic and is_deterministic
+        if fn is None or not all(k in tool_args for k in required):
+            result = f"Error: Invalid tool '{tool_name}' or missing required arguments"
+            deterministic = False
+            if debug:
+                log(f"❌ Error with tool: {result}")
+        else:
+            if debug:
+                log(f"🛠️ Executing tool: {tool_name} with args: {tool_args}")
+            result = fn(**{k: tool_args[k] for k in required})
+            
+            # A tool reports failure in its result (e.g. "Error evaluating
+            # expression: ..."); let the model explain it rather than
+            # showing the raw error as the answer
+            if result.startswith("Error"):
+                deterministic = False
+        
+        if debug:
+            log(f"✅ Tool result: {result}")
+        
+        # Add to history as the answer to this tool call
+        tool_messages.append({"role": "tool", "tool_call_id": tool_call["id"], "content": result})
+        results.append(result)
+    
+    if deterministic:
+        # The results answer the user directly; no need to ask the model
+        response = "\n".join(results)
+        if state["stream"]:
+            print(response, end="", flush=True)
+        if debug:
+            log("⚡ Answering with the tool result directly, skipping the model")
+            log(f"🤖 Final response: {response}")
+        return {
+            "tool_result": result,
+            "response": response,
+            "reasoning_log": reasoning_log,
+            "history": [*tool_messages, {"role": "assistant", "content": response}],
+        }
+    
+    # Store the last result along with the new messages
+    return {"tool_result": result, "reasoning_log": reasoning_log, "history": tool_messages}
+
+
+def route_after_input(state: AgentState) -> Literal["compact_history", "agent"]:
+    """
+    Compact the history first when it has grown too long.
+    """
+    return "compact_history" if len(state["history"]) > SUMMARY_THRESHOLD else "agent"
+
+
+def router(state: AgentState) -> Literal["use_tool", "respond"]:
+    """
+    Run the requested tools, or finish when the model has answered.
+    """
+    return "use_tool" if state["history"][-1].get("tool_calls") else "respond"
+
+
+def after_tool(state: AgentState) -> Literal["agent", "respond"]:
+    """
+    Finish when the tool results were the answer, otherwise let the model
+    write the answer from them.
+    """
+    return "respond" if state["history"][-1]["role"] == "assistant" else "agent"
+
+
+def build_graph(with_reasoning: bool) -> StateGraph:
+    """
+    Build the agent graph with tool integration.
+    
+    Args:
+        with_reasoning: Whether the agent explains its answers
+    
+    Returns:
+        StateGraph: A graph object that can be visualized and compiled
+    """
+    # Create a new graph with the typed agent state
+    graph = StateGraph(AgentState)
+    
+    # Add nodes, telling the agent whether to explain its answers
+    graph.add_node("process_input", process_input)
+    graph.add_node("compact_history", compact_history)
+    graph.add_node("agent", partial(agent, with_reasoning=with_reasoning))
+    graph.add_node("use_tool", use_tool)
+    
+    # Set the entry point
+    graph.set_entry_point("process_input")
+    
+    # Compact a long history before the agent runs
+    graph.add_conditional_edges(
+        "process_input",
+        route_after_input,
+        {
+            "compact_history": "compact_history",
+            "agent": "agent"
+        }
+    )
+    graph.add_edge("compact_history", "agent")
+    
+    # Add conditional edge from agent
+    graph.add_conditional_edges(
+        "agent",
+        router,
+        {
+            "use_tool": "use_tool",
+            "respond": END
+        }
+    )
+    
+    # Tool results go back to the model for the final answer, unless a
+    # deterministic tool already answered the user
+    graph.add_conditional_edges(
+        "use_tool",
+        after_tool,
+        {
+            "agent": "agent",
+            "respond": END
+        }
+    )
+    
+    return graph
+
+
+# Compile both variants of the graph once at import and share them for
+# programmatic use. The in-memory checkpointers keep each conversation
+# thread's state between turns for invoke; the interactive chat in main
+# persists its conversation to disk instead. Batch prompts are single-turn,
+# so they run without a checkpointer and leave nothing behind in memory.
+compiled_graphs = {
+    with_reasoning: build_graph(with_reasoning).compile(checkpointer=MemorySaver())
+    for with_reasoning in (False, True)
+}
+batch_graphs = {
+    with_reasoning: build_graph(with_reasoning).compile()
+    for with_reasoning in (False, True)
+}
+
+
+async def invoke(user_input: str, thread_id: str = "repl", stream: bool = False,
+                 with_reasoning: bool = False, debug: bool = False) -> Dict[str, Any]:
+    """
+    Run one turn of a conversation through the shared compiled graph.
+    
+    Args:
+        user_input: The user's message for this turn
+        thread_id: The conversation to continue
+        stream: Whether to print the response to the terminal as it arrives
+        with_reasoning: Whether to use the agent that explains its reasoning
+        debug: Whether to record each step of the turn in the reasoning log
+    
+    Returns:
+        The graph state after the turn, including the agent's response
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    state = {"input": user_input, "stream": stream, "debug": debug}
+    return await compiled_graphs[with_reasoning].ainvoke(state, config)
+
+
+async def run_batch(prompts: List[str], concurrency: int = 8, with_reasoning: bool = False) -> List[str]:
+    """
+    Answer many independent prompts concurrently, e.g. for offline evaluation.
+    
+    Args:
+        prompts: User messages, each starting its own conversation
+        concurrency: Maximum number of graph runs in flight at once
+        with_reasoning: Whether to use the agent that explains its reasoning
+    
+    Returns:
+        The agent responses, in the same order as the prompts
+    """
+    graph = batch_graphs[with_reasoning]
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_one(prompt: str) -> str:
+        # Each prompt is its own conversation, with no stored state
+        async with semaphore:
+            result = await graph.ainvoke({"input": prompt, "stream": False, "debug": False})
+        return result["response"]
+    
+    return await asyncio.gather(*(run_one(prompt) for prompt in prompts))
+
+
+def save_mermaid_diagram():
+    """
+    Create a Mermaid diagram definition and save it to an HTML file.
+    """
+    mermaid_code = """
+    graph TD
+        START --> process_input
+        process_input -->|long history| compact_history
+        process_input -->|short history| agent
+        compact_history --> agent
+        agent -->|use_tool| use_tool
+        use_tool -->|agent| agent
+        use_tool -->|respond| END
+        agent -->|respond| END
+    """
+    
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>LangGraph Agent Visualization</title>
+        <script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
+        <script>
+            mermaid.initialize({{ startOnLoad: true }});
+        </script>
+    </head>
+    <body>
+        <h1>LangGraph Agent - Flow Visualization</h1>
+        <div class="mermaid">
+        {mermaid_code}
+        </div>
+    </body>
+    </html>
+    """
+    
+    with open("agent_visualization.html", "w") as f:
+        f.write(html_content)
+    
+    print("Saved Mermaid diagram to 'agent_visualization.html'")
+
+
+async def main(with_reasoning: bool = False):
+    """
+    Run the LangGraph agent example.
+    
+    Args:
+        with_reasoning: Whether the agent explains its reasoning; the user can
+            then type 'debug on' to see each step
+    """
+    if with_reasoning:
+        print("\n--- LangGraph Agent with Transparent Reasoning ---\n")
+    else:
+        print("\n--- LangGraph Agent Example ---\n")
+    
+    # The diagram is a one-time artifact, so it is only written on request
+    # (--save-diagram), on a background thread so the chat can start right away
+    if "--save-diagram" in sys.argv:
+        threading.Thread(target=save_mermaid_diagram, daemon=True).start()
+    
+    # Persist the conversation through a SQLite checkpointer so it survives
+    # restarts; each turn stores only what the nodes changed. Each thread_id
+    # is an independent conversation.
+    async with aiosqlite.connect(CHAT_DB_PATH) as conn:
+        compiled_graph = build_graph(with_reasoning).compile(checkpointer=AsyncSqliteSaver(conn))
+        thread_id = chat_thread_id(with_reasoning)
+        config = {"configurable": {"thread_id": thread_id}}
+        
+        snapshot = await compiled_graph.aget_state(config)
+        if snapshot.values:
+            print(f"Resuming conversation '{thread_id}' "
+                  f"({len(snapshot.values['history'])} messages so far).\n")
+        
+        # Interactive conversation loop
+        print("Chat with the agent. You can ask for calculations, weather, or the current time.")
+        if with_reasoning:
+            print("Type 'exit' to end the conversation.")
+            print("Type 'debug on' to see the agent's reasoning.")
+            print("Type 'debug off' to hide the agent's reasoning.\n")
+        else:
+            print("Type 'exit' to end the conversation.\n")
+        
+        show_reasoning = False
+        
+        while True:
+            # Get user input
+            user_input = input("You: ")
+            
+            # Check for exit command
+            if user_input.lower() in ["exit", "quit", "bye"]:
+                print("\nGoodbye!")
+                break
+            
+            # Check for debug commands
+            if with_reasoning and user_input.lower() == "debug on":
+                show_reasoning = True
+                print("Debug mode enabled. You will see the agent's reasoning.")
+                continue
+            elif with_reasoning and user_input.lower() == "debug off":
+                show_reasoning = False
+                print("Debug mode disabled. The agent's reasoning will be hidden.")
+                continue
+            
+            # Run the graph with just this turn's input; the checkpointer
+            # supplies the conversation so far
+            state = {"input": user_input, "stream": not with_reasoning, "debug": show_reasoning}
+            
+            if not with_reasoning:
+                # The response is streamed to the terminal as it arrives
+                print("Agent: ", end="", flush=True)
+                await compiled_graph.ainvoke(state, config)
+                print()
+                continue
+            
+            # The reasoning agent's reply is split into its reasoning and its
+            # response after it completes, so it is printed as a whole
+            result = await compiled_graph.ainvoke(state, config)
+            
+            # Show reasoning if debug mode is on
+            if show_reasoning:
+                print("\n🔍 Agent Reasoning:")
+                for log in result["reasoning_log"]:
+                    print(f"  {log}")
+                print()
+            
+            # Display the response
+            print(f"Agent: {result['response']}\n")
+            
+    print("\n--- End of Example ---\n")
@@ -0,0 +1,126 @@
+"""
+Running OpenAI Batch API jobs and reading their results.
+
+Shared by code4.py and effectiveagents.py, which both submit batches of chat
+completion requests and match the results back to them by custom_id.
+"""
+
+import asyncio
+import orjson
+from typing import Any, Dict, List
+
+# Seconds between status checks while waiting on a batch
+BATCH_POLL_SECONDS = 30
+
+
+async def submit_batch(client, bodies: List[Dict[str, Any]], path: str = "batch_requests.jsonl"):
+    """
+    Run chat completion requests through the Batch API and wait for them.
+    
+    The Batch API is billed at a discount but completes asynchronously
+    (within 24 hours), so this is meant for offline bulk runs.
+    
+    Args:
+        client: The AsyncOpenAI client to submit the batch with
+        bodies: The request body of each chat completion; the i-th request
+            gets the custom_id "request-i"
+        path: Where to write the JSONL request file before uploading it
+    
+    Returns:
+        The batch, once it is in a terminal state other than "failed"; an
+        expired or cancelled batch still has the results of the requests
+        that finished
+    """
+    # Write one chat completion request per body
+    with open(path, "wb") as f:
+        for i, body in enumerate(bodies):
+            request = {
+                "custom_id": f"request-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }
+            f.write(orjson.dumps(request) + b"\n")
+    
+    # Upload the requests and start the batch
+    with open(path, "rb") as f:
+        batch_file = await client.files.create(file=f, purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"Submitted batch {batch.id} with {len(bodies)} requests")
+    
+    # Poll until the batch reaches a terminal state
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await client.batches.retrieve(batch.id)
+        print(f"Batch {batch.id} status: {batch.status}")
+    
+    # A failed batch was rejected as a whole, so it has no results to read
+    if batch.status == "failed":
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+    return batch
+
+
+def parse_batch_line(line: str) -> Dict[str, Any]:
+    """
+    Parse one line of a batch's output or error file.
+    
+    Args:
+        line: A JSON record for one request of the batch
+    
+    Returns:
+        The request's "custom_id", and either the response "body" of a
+        successful request or an "error" describing why it failed
+    """
+    record = orjson.loads(line)
+    result = {"custom_id": record["custom_id"]}
+    
+    # A request fails either before reaching the model ("error" is set and
+    # there is no response) or with a non-200 response whose body holds the error
+    error = record.get("error")
+    response = record.get("response")
+    if error:
+        result["error"] = f"{error.get('code')}: {error.get('message')}"
+    elif not response:
+        result["error"] = "no response"
+    elif response.get("status_code") != 200:
+        body_error = (response.get("body") or {}).get("error") or {}
+        result["error"] = f"HTTP {response.get('status_code')}: {body_error.get('message', 'unknown error')}"
+    else:
+        result["body"] = response["body"]
+    return result
+
+
+async def read_batch_results(client, batch) -> Dict[str, Dict[str, Any]]:
+    """
+    Collect the outcome of every request of a finished batch.
+    
+    Successful requests are in the batch's output file and failed ones in its
+    error file; a file is missing when no request ended up in it (e.g. there
+    is no output file when every request failed). A failed request does not
+    affect the results of the others.
+    
+    Args:
+        client: The AsyncOpenAI client that submitted the batch
+        batch: The batch, in a terminal state
+    
+    Returns:
+        The parsed record of each request (see parse_batch_line), by custom_id.
+        Requests that never ran, e.g. because the batch expired, are missing.
+    """
+    results = {}
+    
+    # Output lines are not guaranteed to be in input order, so key them by custom_id
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await client.files.content(file_id)
+        for line in content.text.splitlines():
+            if line.strip():
+                result = parse_batch_line(line)
+                results[result["custom_id"]] = result
+    
+    return results
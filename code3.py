@@ -9,19 +9,138 @@ context across multiple interactions.
 """
 
 import os
+import sys
+import pathlib
+import json
+import threading
+import asyncio
+import hashlib
+import aiosqlite
+import httpx
 import openai
-from typing import Dict, Any, List
+import orjson
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, TypedDict
+from diskcache import Cache
 from dotenv import load_dotenv
+from openai import AsyncStream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph import StateGraph, END
 
 # Load environment variables from .env file (for API keys)
 load_dotenv()
 
-# Initialize the OpenAI client using the API key from the environment variable
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Read the API key once at import and fail fast if it is missing, before any
+# client or graph is built.
+API_KEY = os.getenv("OPENAI_API_KEY")
+if not API_KEY:
+    sys.exit("Error: OPENAI_API_KEY not found in environment variables.\n"
+             "Please set it in a .env file or export it to your environment.")
 
+# Initialize the async OpenAI client using the API key from the environment variable.
+# A shared httpx client keeps connections alive across calls instead of
+# re-handshaking for every request.
+client = openai.AsyncOpenAI(
+    api_key=API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=32),
+        timeout=60,
+    ),
+)
 
-def memory_node(state: Dict[str, Any]) -> Dict[str, Any]:
+# Chat model used for every call. gpt-4o-mini is far cheaper and faster than
+# gpt-4 for this kind of short conversational reply; set OPENAI_MODEL to override.
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# Generation settings for chat replies. max_tokens bounds worst-case reply
+# latency; the sampling parameters are spelled out so every request is identical.
+COMPLETION_PARAMS = {"max_tokens": 400, "temperature": 0.7, "top_p": 0.9}
+
+# Number of history messages sent to the API on each turn. The full history is
+# kept in the graph state; only this tail is sent so prompt size stays bounded.
+WINDOW = 12
+
+# Once the history grows past this many messages, everything except the last
+# WINDOW messages is folded into a single summary message. This bounds both the
+# stored state and the prompt while keeping salient early context.
+SUMMARY_THRESHOLD = 40
+SUMMARY_INSTRUCTIONS = ("Summarize the following conversation in 200 tokens or fewer, "
+                        "preserving names, dates, and user preferences.")
+
+# SQLite database holding the conversation checkpoints, and the conversation
+# (thread) to continue. Use a different CHAT_THREAD_ID per user or session.
+CHAT_DB_PATH = "memory_example.db"
+THREAD_ID = os.getenv("CHAT_THREAD_ID", "default")
+
+# On-disk cache of assistant replies, keyed on the model and the exact messages
+# sent. A repeated prompt is answered from disk without an API round-trip.
+response_cache = Cache("./.llm_cache")
+
+# System message shared by every call. It is built once at import and kept
+# constant (no per-turn formatting, timestamps or IDs) so OpenAI's automatic
+# prompt caching can reuse the common prefix across turns.
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": ("You are a helpful, friendly assistant that maintains context throughout the conversation. "
+                "If the user shares their name, remember it and use it when relevant."),
+}
+
+
+@dataclass(slots=True, frozen=True)
+class Msg:
+    """A single conversation message as kept in the graph state."""
+    role: str
+    content: str
+
+
+class ChatState(TypedDict):
+    """State passed between the nodes of the chat graph."""
+    history: List[Msg]
+    input: str
+    name: str
+    greeting: str
+    date: str
+    assistant_response: str
+    stream: bool
+
+
+def cache_key(model: str, messages: List[Dict[str, str]]) -> str:
+    """
+    Build the response-cache key for a chat request.
+    
+    The messages are serialized with sorted keys and no whitespace so that
+    equal requests always hash to the same key.
+    """
+    payload = json.dumps(messages, separators=(",", ":"), sort_keys=True)
+    return f"{model}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+async def post_chat_completion(body: Dict[str, Any], stream: bool = False):
+    """
+    Send a chat completion request whose JSON body is encoded with orjson.
+    
+    The SDK encodes request bodies with the stdlib json module; posting
+    pre-encoded bytes skips that step, which matters for long histories.
+    
+    Args:
+        body: The request parameters (model, messages, sampling settings)
+        stream: Whether to stream the completion back chunk by chunk
+    
+    Returns:
+        The chat completion response, or a chunk stream when streaming
+    """
+    return await client.post(
+        "/chat/completions",
+        content=orjson.dumps({**body, "stream": stream}),
+        cast_to=ChatCompletion,
+        stream=stream,
+        stream_cls=AsyncStream[ChatCompletionChunk],
+    )
+
+
+def memory_node(state: ChatState) -> ChatState:
     """
     Process user input and add it to conversation history.
     
@@ -31,20 +150,57 @@ def memory_node(state: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Updated state with user message added to history
     """
-    # Initialize history if it doesn't exist
-    if "history" not in state:
-        state["history"] = []
+    # Add user message to history
+    state["history"].append(Msg("user", state["input"]))
+    
+    return state
+
+
+async def summarize_node(state: ChatState) -> ChatState:
+    """
+    Replace older conversation history with a short summary.
+    
+    Args:
+        state: Dictionary containing the current graph state and history
     
-    # Get user input
-    user_input = state.get("input", "")
+    Returns:
+        Updated state whose history is a summary message plus the recent turns
+    """
+    history = state["history"]
+    older, recent = history[:-WINDOW], history[-WINDOW:]
     
-    # Add user message to history
-    state["history"].append({"role": "user", "content": user_input})
+    # Send the older turns as a plain transcript so the model summarizes them
+    # rather than replying to the last message
+    transcript = "\n".join(f"{message.role}: {message.content}" for message in older)
+    
+    try:
+        response = await post_chat_completion({
+            "model": MODEL,
+            "messages": [
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": transcript},
+            ],
+            "max_tokens": 300,
+        })
+        summary = response.choices[0].message.content.strip()
+    except Exception:
+        # Keep the full history if summarization fails; the window still
+        # bounds what is sent to the API
+        return state
+    
+    state["history"] = [Msg("system", f"Summary so far: {summary}"), *recent]
     
     return state
 
 
-def greeting_node(state: Dict[str, Any]) -> Dict[str, Any]:
+def route_after_memory(state: ChatState) -> Literal["summarize", "greeting"]:
+    """
+    Summarize the history first when it has grown too long.
+    """
+    return "summarize" if len(state["history"]) > SUMMARY_THRESHOLD else "greeting"
+
+
+def greeting_node(state: ChatState) -> ChatState:
     """
     Create a greeting based on user input.
     
@@ -55,7 +211,7 @@ def greeting_node(state: Dict[str, Any]) -> Dict[str, Any]:
         Updated state with a greeting added
     """
     # Get the name from the most recent user message
-    name = state.get("name", "World")
+    name = state["name"]
     
     # Add greeting to state
     state["greeting"] = f"Hello, {name}!"
@@ -64,7 +220,7 @@ def greeting_node(state: Dict[str, Any]) -> Dict[str, Any]:
     return state
 
 
-def openai_response_node(state: Dict[str, Any]) -> Dict[str, Any]:
+async def openai_response_node(state: ChatState) -> ChatState:
     """
     Generate a response using OpenAI API that takes conversation history into account.
     
@@ -75,36 +231,52 @@ def openai_response_node(state: Dict[str, Any]) -> Dict[str, Any]:
         Updated state with OpenAI-generated content
     """
     try:
-        # Prepare messages for the API call
-        messages = []
-        
-        # Add system message to set context
-        messages.append({
-            "role": "system", 
-            "content": "You are a helpful, friendly assistant that maintains context throughout the conversation."
-        })
+        # Static system message first, then the most recent part of the
+        # history, so consecutive turns share a byte-identical prompt prefix.
+        # The opening message is kept as an anchor so early context (e.g. the
+        # user's name) survives once older turns slide out of the window.
+        history = state["history"]
+        if len(history) > WINDOW:
+            history = [history[0], *history[-(WINDOW - 1):]]
         
-        # Add conversation history
-        messages.extend(state.get("history", []))
+        # History is stored as Msg records; API dicts are only built here
+        messages = [SYSTEM_MESSAGE, *[{"role": m.role, "content": m.content} for m in history]]
         
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-        )
+        # Reuse a cached reply for an identical request, otherwise call OpenAI API
+        key = cache_key(MODEL, messages)
+        assistant_message = response_cache.get(key)
+        if assistant_message is None:
+            # Stream the reply so tokens can be shown as soon as they arrive
+            stream = await post_chat_completion(
+                {"model": MODEL, "messages": messages, **COMPLETION_PARAMS},
+                stream=True,
+            )
+            chunks = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if state["stream"]:
+                    print(delta, end="", flush=True)
+                chunks.append(delta)
+            assistant_message = "".join(chunks).strip()
+            response_cache[key] = assistant_message
+        elif state["stream"]:
+            print(assistant_message, end="", flush=True)
         
-        # Extract and add the response to state
-        assistant_message = response.choices[0].message.content.strip()
+        # Add the response to state
         state["assistant_response"] = assistant_message
         
         # Add assistant response to history for future context
-        state["history"].append({"role": "assistant", "content": assistant_message})
+        state["history"].append(Msg("assistant", assistant_message))
         
     except Exception as e:
         # Handle errors gracefully
         error_message = f"I encountered an issue while generating a response: {str(e)}"
+        if state["stream"]:
+            print(error_message, end="", flush=True)
         state["assistant_response"] = error_message
-        state["history"].append({"role": "assistant", "content": error_message})
+        state["history"].append(Msg("assistant", error_message))
     
     return state
 
@@ -116,11 +288,12 @@ def build_graph() -> StateGraph:
     Returns:
         StateGraph: A graph object that can be visualized and compiled
     """
-    # Create a new graph with dictionary state
-    graph = StateGraph(dict)
+    # Create a new graph with the typed chat state
+    graph = StateGraph(ChatState)
     
     # Add our nodes
     graph.add_node("memory", memory_node)
+    graph.add_node("summarize", summarize_node)
     graph.add_node("greeting", greeting_node)
     graph.add_node("openai_response", openai_response_node)
     
@@ -128,7 +301,15 @@ def build_graph() -> StateGraph:
     graph.set_entry_point("memory")
     
     # Add edges to define the flow
-    graph.add_edge("memory", "greeting")
+    graph.add_conditional_edges(
+        "memory",
+        route_after_memory,
+        {
+            "summarize": "summarize",
+            "greeting": "greeting"
+        }
+    )
+    graph.add_edge("summarize", "greeting")
     graph.add_edge("greeting", "openai_response")
     graph.add_edge("openai_response", END)
     
@@ -142,7 +323,9 @@ def save_mermaid_diagram():
     mermaid_code = """
     graph TD
         START --> memory
-        memory --> greeting
+        memory -->|long history| summarize
+        memory -->|short history| greeting
+        summarize --> greeting
         greeting --> openai_response
         openai_response --> END
     """
@@ -166,70 +349,79 @@ def save_mermaid_diagram():
     </html>
     """
     
-    with open("graph_visualization.html", "w") as f:
-        f.write(html_content)
+    # Skip the write when the file already holds this exact diagram
+    path = pathlib.Path("graph_visualization.html")
+    if path.exists() and path.read_text() == html_content:
+        return
+    
+    path.write_text(html_content)
     
     print("Saved Mermaid diagram to 'graph_visualization.html'")
 
 
-def main():
+async def main():
     """Run the LangGraph with memory example."""
     print("\n--- LangGraph with Memory Example ---\n")
     
-    # Check if OpenAI API key is set
-    if not os.getenv("OPENAI_API_KEY"):
-        print("Error: OPENAI_API_KEY not found in environment variables.")
-        print("Please set it in a .env file or export it to your environment.")
-        return
-    
-    # Build and compile the graph
-    graph = build_graph()
-    compiled_graph = graph.compile()
+    # Save a visualization on a background thread so the chat can start
+    # right away; nothing in the chat reads the file
+    threading.Thread(target=save_mermaid_diagram, daemon=True).start()
     
-    # Save a visualization
-    save_mermaid_diagram()
-    
-    # Initialize conversation history
-    state = {"history": []}
-    
-    # Interactive conversation loop
-    print("Chat with the AI assistant. Type 'exit' to end the conversation.\n")
-    
-    while True:
-        # Get user input
-        user_input = input("You: ")
-        
-        # Check for exit command
-        if user_input.lower() in ["exit", "quit", "bye"]:
-            print("\nGoodbye!")
-            break
-        
-        # For the first message, extract name for greeting
-        if not state["history"]:
-            # Try to extract a name from the first message
-            words = user_input.split()
-            if len(words) > 1 and "name" in user_input.lower():
-                # Very simple name extraction, could be improved
-                for word in words:
-                    if word != "my" and word != "name" and word != "is" and len(word) > 2:
-                        state["name"] = word.strip(".,!?")
-                        break
-        
-        # Prepare state for this turn
-        current_state = state.copy()
-        current_state["input"] = user_input
+    # Persist the conversation through a SQLite checkpointer so it survives
+    # restarts. Each thread_id is an independent conversation.
+    # History entries are Msg records, so the serializer is told it may
+    # restore that class when loading a checkpoint.
+    async with aiosqlite.connect(CHAT_DB_PATH) as conn:
+        memory = AsyncSqliteSaver(
+            conn, serde=JsonPlusSerializer(allowed_msgpack_modules=[(Msg.__module__, "Msg")])
+        )
+        compiled_graph = build_graph().compile(checkpointer=memory)
+        config = {"configurable": {"thread_id": THREAD_ID}}
         
-        # Run the graph
-        result = compiled_graph.invoke(current_state)
+        # A new conversation seeds the full state on its first turn; after
+        # that LangGraph loads the stored history from the checkpoint
+        snapshot = await compiled_graph.aget_state(config)
+        new_conversation = not snapshot.values
+        if not new_conversation:
+            print(f"Resuming conversation '{THREAD_ID}' "
+                  f"({len(snapshot.values['history'])} messages so far).\n")
         
-        # Update the persistent state with new history
-        state["history"] = result["history"]
+        # Interactive conversation loop
+        print("Chat with the AI assistant. Type 'exit' to end the conversation.\n")
         
-        # Display the response
-        print(f"Assistant: {result['assistant_response']}")
+        while True:
+            # Get user input
+            user_input = input("You: ")
+            
+            # Check for exit command
+            if user_input.lower() in ["exit", "quit", "bye"]:
+                print("\nGoodbye!")
+                break
+            
+            if new_conversation:
+                # Initialize conversation state and stream replies to the terminal
+                update: ChatState = {
+                    "history": [],
+                    "input": user_input,
+                    "name": "World",
+                    "greeting": "",
+                    "date": "",
+                    "assistant_response": "",
+                    "stream": True,
+                }
+                
+                new_conversation = False
+            else:
+                # Only this turn's input is needed; the rest comes from the checkpoint
+                update = {"input": user_input}
+            
+            # Run the graph; the response is streamed to the terminal as it arrives
+            print("Assistant: ", end="", flush=True)
+            await compiled_graph.ainvoke(update, config)
+            print()
         
     print("\n--- End of Example ---\n")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
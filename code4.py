@@ -8,19 +8,127 @@ allowing the AI to maintain context across multiple conversation turns.
 """
 
 import os
+import pathlib
+import sys
+import json
+import threading
+import re
+import asyncio
+import hashlib
+import aiosqlite
+import httpx
 import openai
-from typing import Dict, Any, List
+import orjson
+import tiktoken
+from dataclasses import dataclass
+from typing import Dict, List, TypedDict
+from aiolimiter import AsyncLimiter
+from diskcache import Cache
 from dotenv import load_dotenv
+from openai import AsyncStream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph import StateGraph, END
+from batch_api import read_batch_results, submit_batch
 
 # Load environment variables from .env file (for API keys)
 load_dotenv()
 
-# Initialize the OpenAI client using the API key from the environment variable
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Read the API key once at import and fail fast if it is missing, before any
+# client or graph is built.
+API_KEY = os.getenv("OPENAI_API_KEY")
+if not API_KEY:
+    sys.exit("Error: OPENAI_API_KEY not found in environment variables.\n"
+             "Please set it in a .env file or export it to your environment.")
 
+# Initialize the async OpenAI client using the API key from the environment variable.
+# A shared httpx client keeps connections alive across calls instead of
+# re-handshaking for every request.
+client = openai.AsyncOpenAI(
+    api_key=API_KEY,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=32),
+        timeout=60,
+    ),
+)
 
-def process_input_and_memory(state: Dict[str, Any]) -> Dict[str, Any]:
+# Chat model used for every call. gpt-4o-mini is far cheaper and faster than
+# gpt-4 for this kind of short conversational reply; set OPENAI_MODEL to override.
+MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# Tokenizer for the chat model, loaded once at import. Building an encoder
+# parses its BPE ranks, so it is shared rather than created per call.
+try:
+    ENCODING = tiktoken.encoding_for_model(MODEL)
+except KeyError:
+    ENCODING = tiktoken.get_encoding("o200k_base")
+
+# Generation settings for chat replies. max_tokens bounds worst-case reply
+# latency; the sampling parameters are spelled out so every request is identical.
+COMPLETION_PARAMS = {"max_tokens": 400, "temperature": 0.7, "top_p": 0.9}
+
+# Number of history messages sent to the API on each turn. The full history is
+# kept in the graph state; only this tail is sent so prompt size stays bounded.
+WINDOW = 12
+
+# Account rate limits for the chat endpoint. Requests wait on these token
+# buckets instead of bursting past the limits and triggering 429 retry storms.
+MAX_REQUESTS_PER_MINUTE = 500
+MAX_TOKENS_PER_MINUTE = 90_000
+request_limiter = AsyncLimiter(MAX_REQUESTS_PER_MINUTE, 60)
+token_limiter = AsyncLimiter(MAX_TOKENS_PER_MINUTE, 60)
+
+# Canned replies for conversational fillers. With CANNED_SMALL_TALK=1 these are
+# answered locally instead of paying for an API round-trip.
+CANNED_SMALL_TALK = os.getenv("CANNED_SMALL_TALK") == "1"
+SMALL_TALK_RE = re.compile(r"^\s*(hi|hello|hey|thanks|thank you|bye)[.! ]*$", re.IGNORECASE)
+SMALL_TALK_REPLIES = {
+    "hi": "Hi there! How can I help you today?",
+    "hello": "Hello! How can I help you today?",
+    "hey": "Hey! What can I do for you?",
+    "thanks": "You're welcome!",
+    "thank you": "You're welcome!",
+    "bye": "Goodbye! Come back any time.",
+}
+
+# SQLite database holding the conversation checkpoints, and the conversation
+# (thread) to continue. Use a different CHAT_THREAD_ID per user or session.
+CHAT_DB_PATH = "chat_memory.db"
+THREAD_ID = os.getenv("CHAT_THREAD_ID", "default")
+
+# On-disk cache of assistant replies, keyed on the model and the exact messages
+# sent. A repeated prompt is answered from disk without an API round-trip.
+response_cache = Cache("./.llm_cache")
+
+# System message shared by every call. It is built once at import and kept
+# constant (no per-turn formatting, timestamps or IDs) so OpenAI's automatic
+# prompt caching can reuse the common prefix across turns.
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": ("You are a helpful, friendly assistant that maintains context throughout "
+                "the conversation. You remember details the user has shared previously "
+                "and refer back to them when relevant."),
+}
+
+
+@dataclass(slots=True, frozen=True)
+class Msg:
+    """A single conversation message as kept in the graph state."""
+    role: str
+    content: str
+
+
+class ChatState(TypedDict):
+    """State passed between the nodes of the chat graph."""
+    history: List[Msg]
+    input: str
+    response: str
+    stream: bool
+
+
+def process_input_and_memory(state: ChatState) -> ChatState:
     """
     Process the user's input and update the conversation memory.
     
@@ -30,20 +138,91 @@ def process_input_and_memory(state: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Updated state with user message added to history
     """
-    # Initialize history if it doesn't exist
-    if "history" not in state:
-        state["history"] = []
-    
-    # Get user input
-    user_input = state.get("input", "")
-    
     # Add user message to history
-    state["history"].append({"role": "user", "content": user_input})
+    state["history"].append(Msg("user", state["input"]))
     
     return state
 
 
-def generate_ai_response(state: Dict[str, Any]) -> Dict[str, Any]:
+def build_messages(history: List[Msg]) -> List[Dict[str, str]]:
+    """
+    Build the message list sent to the chat API for a conversation.
+    
+    Args:
+        history: The full conversation history
+    
+    Returns:
+        The system message followed by the windowed history
+    """
+    # Static system message first, then the most recent part of the history,
+    # so consecutive turns share a byte-identical prompt prefix. The opening
+    # message is kept as an anchor so early context (e.g. the user's name)
+    # survives once older turns slide out of the window.
+    if len(history) > WINDOW:
+        history = [history[0], *history[-(WINDOW - 1):]]
+    
+    # History is stored as Msg records; API dicts are only built here
+    return [SYSTEM_MESSAGE, *[{"role": m.role, "content": m.content} for m in history]]
+
+
+def cache_key(model: str, messages: List[Dict[str, str]]) -> str:
+    """
+    Build the response-cache key for a chat request.
+    
+    The messages are serialized with sorted keys and no whitespace so that
+    equal requests always hash to the same key.
+    """
+    payload = json.dumps(messages, separators=(",", ":"), sort_keys=True)
+    return f"{model}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """
+    Estimate how many tokens a request counts against the rate limit.
+    
+    This is the tokenized prompt, plus a small per-message overhead for the
+    role and formatting, plus the completion budget (max_tokens).
+    """
+    prompt_tokens = sum(len(ENCODING.encode(message["content"])) + 4 for message in messages)
+    return prompt_tokens + COMPLETION_PARAMS["max_tokens"]
+
+
+async def create_chat_completion(messages: List[Dict[str, str]], stream: bool = False):
+    """
+    Call the chat API within the account rate limits.
+    
+    Each call takes one request slot and its estimated token count from the
+    limiters before it is sent. Rate-limit errors are retried with randomized
+    exponential backoff. The request body is encoded with orjson and posted
+    as raw bytes, skipping the SDK's slower stdlib json encoding.
+    
+    Args:
+        messages: The messages to send
+        stream: Whether to stream the completion back chunk by chunk
+    
+    Returns:
+        The chat completion response, or a chunk stream when streaming
+    """
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type(openai.RateLimitError),
+        stop=stop_after_attempt(6),
+        wait=wait_random_exponential(min=1, max=60),
+        reraise=True,
+    ):
+        with attempt:
+            async with request_limiter:
+                await token_limiter.acquire(estimate_tokens(messages))
+                body = {"model": MODEL, "messages": messages, "stream": stream, **COMPLETION_PARAMS}
+                return await client.post(
+                    "/chat/completions",
+                    content=orjson.dumps(body),
+                    cast_to=ChatCompletion,
+                    stream=stream,
+                    stream_cls=AsyncStream[ChatCompletionChunk],
+                )
+
+
+async def generate_ai_response(state: ChatState) -> ChatState:
     """
     Generate a response using OpenAI API that takes conversation history into account.
     
@@ -53,39 +232,52 @@ def generate_ai_response(state: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Updated state with OpenAI-generated content and updated history
     """
+    # Answer simple small talk locally when enabled, skipping the API call
+    small_talk = SMALL_TALK_RE.match(state["input"]) if CANNED_SMALL_TALK else None
+    if small_talk:
+        reply = SMALL_TALK_REPLIES[small_talk.group(1).lower()]
+        if state["stream"]:
+            print(reply, end="", flush=True)
+        state["response"] = reply
+        state["history"].append(Msg("assistant", reply))
+        return state
+    
     try:
         # Prepare messages for the API call
-        messages = []
-        
-        # Add system message to set context
-        messages.append({
-            "role": "system", 
-            "content": ("You are a helpful, friendly assistant that maintains context throughout "
-                        "the conversation. You remember details the user has shared previously "
-                        "and refer back to them when relevant.")
-        })
+        messages = build_messages(state["history"])
         
-        # Add conversation history
-        messages.extend(state.get("history", []))
+        # Reuse a cached reply for an identical request, otherwise call OpenAI API
+        key = cache_key(MODEL, messages)
+        assistant_message = response_cache.get(key)
+        if assistant_message is None:
+            # Stream the reply so tokens can be shown as soon as they arrive
+            stream = await create_chat_completion(messages, stream=True)
+            chunks = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if state["stream"]:
+                    print(delta, end="", flush=True)
+                chunks.append(delta)
+            assistant_message = "".join(chunks).strip()
+            response_cache[key] = assistant_message
+        elif state["stream"]:
+            print(assistant_message, end="", flush=True)
         
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-        )
-        
-        # Extract and add the response to state
-        assistant_message = response.choices[0].message.content.strip()
+        # Add the response to state
         state["response"] = assistant_message
         
         # Add assistant response to history for future context
-        state["history"].append({"role": "assistant", "content": assistant_message})
+        state["history"].append(Msg("assistant", assistant_message))
         
     except Exception as e:
         # Handle errors gracefully
         error_message = f"I encountered an issue while generating a response: {str(e)}"
+        if state["stream"]:
+            print(error_message, end="", flush=True)
         state["response"] = error_message
-        state["history"].append({"role": "assistant", "content": error_message})
+        state["history"].append(Msg("assistant", error_message))
     
     return state
 
@@ -97,8 +289,8 @@ def build_graph() -> StateGraph:
     Returns:
         StateGraph: A graph object that can be compiled
     """
-    # Create a new graph with dictionary state
-    graph = StateGraph(dict)
+    # Create a new graph with the typed chat state
+    graph = StateGraph(ChatState)
     
     # Add our nodes
     graph.add_node("process_input", process_input_and_memory)
@@ -144,59 +336,143 @@ def save_mermaid_diagram():
     </html>
     """
     
-    with open("graph_visualization.html", "w") as f:
-        f.write(html_content)
+    # Skip the write when the file already holds this exact diagram
+    path = pathlib.Path("graph_visualization.html")
+    if path.exists() and path.read_text() == html_content:
+        return
+    
+    path.write_text(html_content)
     
     print("Saved Mermaid diagram to 'graph_visualization.html'")
 
 
-def main():
-    """Run the LangGraph with memory example."""
-    print("\n--- LangGraph with Memory Example ---\n")
+async def run_many(inputs: List[str], concurrency: int = 20) -> List[str]:
+    """
+    Answer many independent single-turn prompts concurrently.
     
-    # Check if OpenAI API key is set
-    if not os.getenv("OPENAI_API_KEY"):
-        print("Error: OPENAI_API_KEY not found in environment variables.")
-        print("Please set it in a .env file or export it to your environment.")
-        return
+    Args:
+        inputs: User messages, each starting its own conversation
+        concurrency: Maximum number of graph runs in flight at once
     
-    # Build and compile the graph
-    graph = build_graph()
-    compiled_graph = graph.compile()
+    Returns:
+        The assistant responses, in the same order as the inputs
+    """
+    compiled_graph = build_graph().compile()
+    semaphore = asyncio.Semaphore(concurrency)
     
-    # Save a visualization
-    save_mermaid_diagram()
+    async def run_one(user_input: str) -> str:
+        async with semaphore:
+            state: ChatState = {"history": [], "input": user_input, "response": "", "stream": False}
+            result = await compiled_graph.ainvoke(state)
+        return result["response"]
     
-    # Initialize conversation history
-    state = {"history": []}
+    return await asyncio.gather(*(run_one(user_input) for user_input in inputs))
+
+
+async def run_batch_api(inputs: List[str], path: str = "batch_requests.jsonl") -> List[str]:
+    """
+    Answer many single-turn prompts through the OpenAI Batch API.
     
-    # Interactive conversation loop
-    print("Chat with the AI assistant. Type 'exit' to end the conversation.\n")
+    The Batch API is billed at a discount but completes asynchronously
+    (within 24 hours), so this is meant for offline bulk runs.
     
-    while True:
-        # Get user input
-        user_input = input("You: ")
-        
-        # Check for exit command
-        if user_input.lower() in ["exit", "quit", "bye"]:
-            print("\nGoodbye!")
-            break
-            
-        # Prepare state for this turn
-        current_state = state.copy()
-        current_state["input"] = user_input
+    Args:
+        inputs: User messages, each starting its own conversation
+        path: Where to write the JSONL request file before uploading it
+    
+    Returns:
+        The assistant responses, in the same order as the inputs. A request
+        that failed or never ran gets a message saying so instead.
+    """
+    batch = await submit_batch(client, [
+        {"model": MODEL, "messages": build_messages([Msg("user", user_input)]), **COMPLETION_PARAMS}
+        for user_input in inputs
+    ], path)
+    
+    # Match the results back to the inputs; one failed request doesn't lose the others
+    results = await read_batch_results(client, batch)
+    responses = []
+    for i in range(len(inputs)):
+        result = results.get(f"request-{i}")
+        if result is None:
+            responses.append("No response was returned for this request.")
+        elif "error" in result:
+            responses.append(f"The request failed ({result['error']}).")
+        else:
+            responses.append(result["body"]["choices"][0]["message"]["content"].strip())
+    return responses
+
+
+async def batch_main(path: str):
+    """Answer every line of a prompts file using the Batch API."""
+    with open(path) as f:
+        inputs = [line.strip() for line in f if line.strip()]
+    
+    responses = await run_batch_api(inputs)
+    
+    for user_input, response in zip(inputs, responses):
+        print(f"You: {user_input}")
+        print(f"Assistant: {response}\n")
+
+
+async def main():
+    """Run the LangGraph with memory example."""
+    print("\n--- LangGraph with Memory Example ---\n")
+    
+    # Save a visualization on a background thread so the chat can start
+    # right away; nothing in the chat reads the file
+    threading.Thread(target=save_mermaid_diagram, daemon=True).start()
+    
+    # Persist the conversation through a SQLite checkpointer so it survives
+    # restarts. Each thread_id is an independent conversation.
+    # History entries are Msg records, so the serializer is told it may
+    # restore that class when loading a checkpoint.
+    async with aiosqlite.connect(CHAT_DB_PATH) as conn:
+        memory = AsyncSqliteSaver(
+            conn, serde=JsonPlusSerializer(allowed_msgpack_modules=[(Msg.__module__, "Msg")])
+        )
+        compiled_graph = build_graph().compile(checkpointer=memory)
+        config = {"configurable": {"thread_id": THREAD_ID}}
         
-        # Run the graph
-        result = compiled_graph.invoke(current_state)
+        # A new conversation seeds the full state on its first turn; after
+        # that LangGraph loads the stored history from the checkpoint
+        snapshot = await compiled_graph.aget_state(config)
+        new_conversation = not snapshot.values
+        if not new_conversation:
+            print(f"Resuming conversation '{THREAD_ID}' "
+                  f"({len(snapshot.values['history'])} messages so far).\n")
         
-        # Update the persistent state with new history
-        state["history"] = result["history"]
+        # Interactive conversation loop
+        print("Chat with the AI assistant. Type 'exit' to end the conversation.\n")
         
-        # Display the response
-        print(f"Assistant: {result['response']}")
+        while True:
+            # Get user input
+            user_input = input("You: ")
+            
+            # Check for exit command
+            if user_input.lower() in ["exit", "quit", "bye"]:
+                print("\nGoodbye!")
+                break
+            
+            if new_conversation:
+                # Initialize conversation state and stream replies to the terminal
+                update: ChatState = {"history": [], "input": user_input, "response": "", "stream": True}
+                new_conversation = False
+            else:
+                # Only this turn's input is needed; the rest comes from the checkpoint
+                update = {"input": user_input}
+            
+            # Run the graph; the response is streamed to the terminal as it arrives
+            print("Assistant: ", end="", flush=True)
+            await compiled_graph.ainvoke(update, config)
+            print()
         
     print("\n--- End of Example ---\n")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Usage: code4.py [--batch prompts.txt]
+    if len(sys.argv) == 3 and sys.argv[1] == "--batch":
+        asyncio.run(batch_main(sys.argv[2]))
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -8,21 +8,207 @@ detailed, step-by-step reasoning inspired by chain-of-thought approaches.
 """
 
 import os
+import sys
 import json
 import datetime
 import re
+import calendar
 import math
+import ast
+import operator
+import random
 import time
-from typing import Dict, Any, List, Literal
+import asyncio
+import threading
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Literal, Optional, Tuple
+import numpy as np
+from diskcache import Cache
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 
 # Load environment variables from .env file (for API keys)
 load_dotenv()
 
-# Initialize OpenAI client
+# Read the API key once at import and fail fast if it is missing, before any
+# client or graph is built.
+API_KEY = os.getenv("OPENAI_API_KEY")
+if not API_KEY:
+    sys.exit("Error: OPENAI_API_KEY not found in environment variables.\n"
+             "Please set it in a .env file or export it to your environment.")
+
+# Initialize the async OpenAI client, so independent model calls can overlap
 import openai
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = openai.AsyncOpenAI(api_key=API_KEY)
+
+# Choosing between three tools is a simple classification, so the decision
+# runs on a small, fast model; gpt-4 is kept for the final response.
+DECISION_MODEL = "gpt-4o-mini"
+
+# On-disk cache of DeepThink decisions (the reasoning and the tool call), keyed
+# on the normalized user message. A repeated request reuses the earlier
+# decision without an API round-trip.
+decision_cache = Cache("./.deepthink_cache")
+
+# Runs of whitespace, collapsed when normalizing messages
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def decision_key(message: str) -> str:
+    """
+    Build the decision-cache key for a user message.
+    
+    The message is lowercased and its whitespace collapsed, so that trivially
+    different spellings of the same request share a key.
+    """
+    normalized = WHITESPACE_RE.sub(" ", message.strip().lower())
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+# Semantic cache of DeepThink decisions. A paraphrase of an earlier request
+# ("calc 25 times 16" for "what's 25*16") misses the exact cache but has a
+# very similar embedding, so its earlier reasoning is reused. The embeddings
+# are kept as the rows of one matrix, so a lookup is a single product with it.
+# The matrix grows by doubling rather than being copied on every insert, and
+# once it holds SEMANTIC_CACHE_SIZE entries the oldest is overwritten.
+# All three tools are side-effect free, so any decision may be reused.
+EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_LOOKUP_TIMEOUT = 0.3  # Seconds a decision waits on the embedding before going ahead
+SEMANTIC_CACHE_SIZE = 1024
+embedding_matrix: Optional[np.ndarray] = None
+embedding_payloads: List[Dict[str, Any]] = []
+embedding_count = 0  # Entries stored so far, including overwritten ones
+
+
+async def embed(text: str) -> np.ndarray:
+    """
+    Embed a message and normalize it to unit length, so that a dot product
+    between two embeddings is their cosine similarity.
+    """
+    response = await client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def embedding_result(task: asyncio.Task) -> Optional[np.ndarray]:
+    """
+    Return the embedding computed by a finished embed task, or None if it failed.
+    """
+    if task.cancelled() or task.exception() is not None:
+        return None
+    return task.result()
+
+
+def semantic_lookup(vector: np.ndarray, message: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the cached decision for the most similar earlier request, if it
+    is at least SEMANTIC_CACHE_THRESHOLD similar.
+    
+    Similar requests can still differ in their details ("25*16" and "25*17"),
+    so a decision is only reused when its tool arguments appear in this message.
+    """
+    if embedding_matrix is None:
+        return None
+    similarities = embedding_matrix[:len(embedding_payloads)] @ vector
+    best = int(similarities.argmax())
+    if similarities[best] < SEMANTIC_CACHE_THRESHOLD:
+        return None
+    
+    decision = embedding_payloads[best]
+    if decision["tool_call"]:
+        try:
+            args = json.loads(decision["tool_call"]["arguments"] or "{}")
+        except json.JSONDecodeError:
+            return None
+        normalized = WHITESPACE_RE.sub("", message.lower())
+        if not all(WHITESPACE_RE.sub("", str(value).lower()) in normalized for value in args.values()):
+            return None
+    return decision
+
+
+def semantic_store(vector: np.ndarray, decision: Dict[str, Any]):
+    """
+    Add a request's embedding and its decision to the semantic cache.
+    """
+    global embedding_matrix, embedding_count
+    index = embedding_count % SEMANTIC_CACHE_SIZE
+    if embedding_matrix is None:
+        embedding_matrix = np.empty((min(16, SEMANTIC_CACHE_SIZE), vector.shape[0]), dtype=np.float32)
+    elif index >= embedding_matrix.shape[0]:
+        # Out of rows: double the capacity, up to SEMANTIC_CACHE_SIZE
+        rows = min(2 * embedding_matrix.shape[0], SEMANTIC_CACHE_SIZE)
+        grown = np.empty((rows, vector.shape[0]), dtype=np.float32)
+        grown[:index] = embedding_matrix[:index]
+        embedding_matrix = grown
+    
+    embedding_matrix[index] = vector
+    if index < len(embedding_payloads):
+        embedding_payloads[index] = decision
+    else:
+        embedding_payloads.append(decision)
+    embedding_count += 1
+
+
+# Math functions and constants the calculator may use, built once at import
+ALLOWED_NAMES = {
+    k: v for k, v in math.__dict__.items()
+    if not k.startswith('__')
+}
+
+
+# Arithmetic operators the calculator supports
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+@lru_cache(maxsize=512)
+def parse_expression(expression: str) -> ast.expr:
+    """
+    Parse an expression into its syntax tree. Repeated expressions reuse the tree.
+    """
+    return ast.parse(expression, mode="eval").body
+
+
+def evaluate(node: ast.expr) -> Any:
+    """
+    Evaluate a parsed arithmetic expression.
+    
+    Only numbers, the operators in OPERATORS and the names in ALLOWED_NAMES
+    are accepted, so unlike eval() this cannot run arbitrary code.
+    
+    Args:
+        node: A node of the parsed expression
+        
+    Returns:
+        The value of the expression
+    """
+    node_type = type(node)
+    
+    if node_type is ast.Constant and type(node.value) in (int, float, complex):
+        return node.value
+    if node_type is ast.BinOp and type(node.op) in OPERATORS:
+        return OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right))
+    if node_type is ast.UnaryOp and type(node.op) in OPERATORS:
+        return OPERATORS[type(node.op)](evaluate(node.operand))
+    if node_type is ast.Name and node.id in ALLOWED_NAMES:
+        return ALLOWED_NAMES[node.id]
+    if (node_type is ast.Call and type(node.func) is ast.Name
+            and node.func.id in ALLOWED_NAMES and not node.keywords):
+        return ALLOWED_NAMES[node.func.id](*[evaluate(arg) for arg in node.args])
+    
+    raise ValueError(f"unsupported expression '{ast.unparse(node)}'")
 
 
 # Define tools that our agent can use
@@ -37,14 +223,8 @@ def calculator(expression: str) -> str:
         The result of the calculation
     """
     try:
-        # Use safer eval with math functions
-        allowed_names = {
-            k: v for k, v in math.__dict__.items() 
-            if not k.startswith('__')
-        }
-        
-        # Evaluate the expression
-        result = eval(expression, {"__builtins__": {}}, allowed_names)
+        # Walk the parsed expression instead of eval()-ing it
+        result = evaluate(parse_expression(expression))
         return f"Result of {expression} = {result}"
     except Exception as e:
         return f"Error evaluating expression: {str(e)}"
@@ -57,8 +237,12 @@ def get_current_time() -> str:
     Returns:
         A string with the current date and time
     """
-    now = datetime.datetime.now()
-    return f"Current time: {now.strftime('%Y-%m-%d %H:%M:%S')}"
+    # Same "YYYY-MM-DD HH:MM:SS" text as strftime, without parsing a format string
+    return f"Current time: {datetime.datetime.now().isoformat(' ', 'seconds')}"
+
+
+# Possible conditions for the simulated weather, built once
+WEATHERS = ("sunny", "cloudy", "rainy", "snowy", "windy")
 
 
 def get_weather(location: str) -> str:
@@ -72,16 +256,169 @@ def get_weather(location: str) -> str:
         Weather information for the specified location
     """
     # This is a mock implementation - in a real app, you would call a weather API
-    weathers = ["sunny", "cloudy", "rainy", "snowy", "windy"]
-    temps = range(0, 35)
-    
-    import random
-    weather = random.choice(weathers)
-    temp = random.choice(temps)
+    weather = WEATHERS[random.randrange(len(WEATHERS))]
+    temp = random.randrange(35)
     
     return f"Weather in {location}: {weather} with a temperature of {temp}°C"
 
 
+# Cache of recent tool results: (tool name, canonical arguments) -> (time, result).
+# All three tools are read-only, so a result can be reused for as long as it is
+# still accurate: the weather for ten minutes, the time for a second, and a
+# calculation forever. Expired results are dropped when they are read, and
+# the least recently used ones once the cache holds TOOL_CACHE_SIZE. The lock
+# is there because weather lookups are also prefetched on a background thread.
+TOOL_CACHE_TTL = {"calculator": float("inf"), "get_current_time": 1.0, "get_weather": 600.0}
+TOOL_CACHE_SIZE = 256
+tool_cache: "OrderedDict[Tuple[str, Tuple[Tuple[str, str], ...]], Tuple[float, str]]" = OrderedDict()
+tool_cache_lock = threading.Lock()
+
+
+def tool_cache_key(tool_name: str, tool_args: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """
+    Build the tool-cache key for a tool call.
+    
+    The arguments are canonicalized (sorted, stripped and lowercased), so
+    calls such as get_weather("Paris") and get_weather("paris ") share a key.
+    """
+    return tool_name, tuple(sorted((k, str(v).strip().lower()) for k, v in tool_args.items()))
+
+
+def tool_cache_get(key: Tuple[str, Tuple[Tuple[str, str], ...]]) -> Optional[str]:
+    """
+    Return the cached result of a tool call if it is still fresh, dropping it if it expired.
+    """
+    with tool_cache_lock:
+        cached = tool_cache.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[0] >= TOOL_CACHE_TTL[key[0]]:
+            del tool_cache[key]
+            return None
+        tool_cache.move_to_end(key)
+        return cached[1]
+
+
+def tool_cache_put(key: Tuple[str, Tuple[Tuple[str, str], ...]], started: float, result: str):
+    """
+    Cache the result of a tool call made at time started (time.monotonic()).
+    """
+    with tool_cache_lock:
+        tool_cache[key] = (started, result)
+        tool_cache.move_to_end(key)
+        if len(tool_cache) > TOOL_CACHE_SIZE:
+            tool_cache.popitem(last=False)
+
+
+# Tools the agent can call, by name
+TOOL_FUNCTIONS = {
+    "calculator": calculator,
+    "get_current_time": get_current_time,
+    "get_weather": get_weather,
+}
+
+
+# JSON Schema descriptions of the tools, sent with the decision request so the
+# model can pick one through OpenAI's native tool calling
+TOOL_SCHEMAS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "calculator",
+            "description": "Evaluate a mathematical expression.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "expression": {"type": "string", "description": "The expression to evaluate, e.g. 25 * 16"},
+                },
+                "required": ["expression"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_current_time",
+            "description": "Get the current date and time.",
+            "parameters": {"type": "object", "properties": {}},
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "description": "Get the current weather for a location.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "location": {"type": "string", "description": "City or location to check"},
+                },
+                "required": ["location"],
+            },
+        },
+    },
+]
+
+
+# Fast path for requests that obviously need one tool. These patterns are
+# checked before any model call; only messages they don't match go to DeepThink.
+CALCULATION_RE = re.compile(r"^\s*(?:what is|what's|calculate|calc|compute)?\s*([\d\s+\-*/().%]*\d[\d\s+\-*/().%]*?)\s*[?=]?\s*$", re.IGNORECASE)
+TIME_RE = re.compile(r"\bwhat time is it\b|\b(?:current|today's) (?:time|date)\b|"
+                     r"\bwhat(?:'s| is) the (?:time|date)(?: now| today| right now)?\s*[?.!]?\s*$", re.IGNORECASE)
+WEATHER_RE = re.compile(r"\bweather (?:in|for|at) ([A-Za-z][A-Za-z .,'-]*?)(?:\s+(?:today|now|right now))?\s*[?.!]?\s*$",
+                        re.IGNORECASE)
+
+
+def fast_path_decision(message: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Match a message against the fast-path patterns.
+    
+    Args:
+        message: The user's message
+        
+    Returns:
+        A (tool_name, tool_args) pair for an obvious tool request, or None
+    """
+    match = CALCULATION_RE.match(message)
+    if match and any(op in match.group(1) for op in "+-*/%"):
+        return "calculator", {"expression": match.group(1).strip()}
+    if TIME_RE.search(message):
+        return "get_current_time", {}
+    match = WEATHER_RE.search(message)
+    if match:
+        return "get_weather", {"location": match.group(1).strip()}
+    return None
+
+
+# Looser hints that a request may need a tool. When one matches, the tool is
+# started on a worker thread while DeepThink decides, and its result is kept
+# if DeepThink then makes that same call.
+TIME_HINT_RE = re.compile(r"\b(?:time|date|today)\b", re.IGNORECASE)
+WEATHER_HINT_RE = re.compile(r"\b(?i:weather)\b.*?\b(?:in|for|at) ([A-Z][\w'-]*(?: [A-Z][\w'-]*)*)")
+tool_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def speculate_tool(message: str) -> Optional[Tuple[str, Dict[str, Any], float, Future]]:
+    """
+    Start the tool call a message hints at, if any, before it is decided.
+    
+    Args:
+        message: The user's message
+        
+    Returns:
+        The speculated tool name, its arguments, the time.monotonic() at
+        which the call was started and the running call, or None
+    """
+    match = WEATHER_HINT_RE.search(message)
+    if match:
+        tool_name, args = "get_weather", {"location": match.group(1)}
+    elif TIME_HINT_RE.search(message):
+        tool_name, args = "get_current_time", {}
+    else:
+        return None
+    return tool_name, args, time.monotonic(), tool_executor.submit(TOOL_FUNCTIONS[tool_name], **args)
+
+
 # Define states and functions for our agent
 def process_input(state: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -107,7 +444,7 @@ def process_input(state: Dict[str, Any]) -> Dict[str, Any]:
     
     # Add to reasoning log
     state["reasoning_log"].append(f"📝 Received user input: \"{user_input}\"")
-    state["deepthink_log"].append({
+    add_thought(state, {
         "phase": "input_processing",
         "thought": f"User has provided the input: \"{user_input}\". Now I need to understand what they're asking for."
     })
@@ -115,9 +452,135 @@ def process_input(state: Dict[str, Any]) -> Dict[str, Any]:
     return state
 
 
-def deepthink_decision(state: Dict[str, Any]) -> Dict[str, Any]:
+# Patterns splitting step-by-step completions into their STEP lines and final
+# response, compiled once at import. While streaming, a STEP is complete once
+# the next step or the concluding section has begun.
+STEP_RE = re.compile(r"STEP \d+: (.*?)(?=STEP \d+:|FINAL RESPONSE:|$)", re.DOTALL)
+COMPLETE_STEP_RE = re.compile(r"STEP \d+: (.*?)(?=STEP \d+:|FINAL RESPONSE:)", re.DOTALL)
+FINAL_RESPONSE_RE = re.compile(r"FINAL RESPONSE: (.*)", re.DOTALL)
+
+
+def add_thought(state: Dict[str, Any], entry: Dict[str, Any]):
+    """
+    Record an entry in the DeepThink log, and show it right away when the
+    caller passed an on_thought callback in the state.
+    """
+    state["deepthink_log"].append(entry)
+    if state.get("on_thought"):
+        state["on_thought"](entry)
+
+
+def add_thoughts(state: Dict[str, Any], entries: List[Dict[str, Any]]):
+    """
+    Record several entries in the DeepThink log at once, like add_thought.
+    """
+    state["deepthink_log"].extend(entries)
+    if state.get("on_thought"):
+        for entry in entries:
+            state["on_thought"](entry)
+
+
+def step_entries(steps: List[str], phase: str, first: int) -> List[Dict[str, Any]]:
+    """
+    Build DeepThink log entries for reasoning steps, numbered from first.
+    """
+    return [{"phase": phase, "step": i, "thought": step.strip()} for i, step in enumerate(steps, first)]
+
+
+async def stream_steps(request: Dict[str, Any], state: Dict[str, Any],
+                       phase: str) -> Tuple[str, int, Optional[Dict[str, str]]]:
+    """
+    Stream a step-by-step completion, recording each STEP as soon as it is
+    complete instead of after the whole completion has arrived.
+    
+    Args:
+        request: The chat request parameters
+        state: Dictionary containing the current graph state
+        phase: DeepThink log phase for the recorded steps
+        
+    Returns:
+        The full completion text, the number of steps already recorded, and
+        the first tool call the model made (its name and JSON arguments), if any
+    """
+    stream = await client.chat.completions.create(**request, stream=True)
+    chunks = []
+    recorded = 0
+    tool_call = None
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        
+        # A tool call arrives in pieces; only the first one is used
+        for call in chunk.choices[0].delta.tool_calls or []:
+            if call.index == 0:
+                tool_call = tool_call or {"name": "", "arguments": ""}
+                tool_call["name"] += call.function.name or ""
+                tool_call["arguments"] += call.function.arguments or ""
+        
+        delta = chunk.choices[0].delta.content or ""
+        chunks.append(delta)
+        
+        # Every section marker ends with a colon, so only look for newly
+        # completed steps when one may have arrived
+        if ":" in delta:
+            steps = COMPLETE_STEP_RE.findall("".join(chunks))
+            add_thoughts(state, step_entries(steps[recorded:], phase, recorded + 1))
+            recorded = len(steps)
+    
+    return "".join(chunks).strip(), recorded, tool_call
+
+
+# Prompts for the final response, with or without a tool result. They are
+# kept short since they are sent on every turn.
+RESPONSE_FORMAT = ("Reason in a few short lines formatted as 'STEP 1: ...', 'STEP 2: ...', "
+                   "then give the actual response to the user after 'FINAL RESPONSE: '.")
+TOOL_RESPONSE_TEMPLATE = ("You are a helpful assistant with strong reasoning abilities.\n"
+                          "The user asked: \"{question}\"\n"
+                          "You used the {tool_name} tool, which returned: \"{tool_result}\"\n"
+                          "Think step by step about how to present this result clearly and helpfully. "
+                          + RESPONSE_FORMAT)
+DIRECT_RESPONSE_TEMPLATE = ("You are a helpful assistant with strong reasoning abilities.\n"
+                            "The user asked: \"{question}\"\n"
+                            "Think step by step about how to respond using what you already know, "
+                            "without external tools. " + RESPONSE_FORMAT)
+MAX_TOOL_RESULT_CHARS = 2000
+
+
+def response_request(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the chat request for the final, step-by-step response.
+    
+    Args:
+        state: Dictionary containing the current graph state
+        
+    Returns:
+        The request parameters (model, messages, temperature)
+    """
+    # Ask about the current request (not the first one of the conversation),
+    # with the tool result capped so a large one can't blow up the prompt
+    if state.get("action") == "use_tool":
+        system_message = TOOL_RESPONSE_TEMPLATE.format(
+            question=state["input"],
+            tool_name=state["tool_name"],
+            tool_result=str(state["tool_result"])[:MAX_TOOL_RESULT_CHARS],
+        )
+    else:
+        system_message = DIRECT_RESPONSE_TEMPLATE.format(question=state["input"])
+    
+    return {
+        "model": "gpt-4",
+        "messages": [{"role": "system", "content": system_message}],
+        "temperature": 0.7,  # Higher temperature for more creative responses
+    }
+
+
+async def deepthink_decision(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Perform detailed, token-by-token reasoning to decide which action to take.
+    
+    While the model decides, a direct response is drafted at the same time.
+    If no tool is needed, deepthink_response uses that draft instead of making
+    a second call; otherwise the draft is discarded.
     """
     # Access the latest user message
     latest_message = state["history"][-1]["content"]
@@ -125,30 +588,40 @@ def deepthink_decision(state: Dict[str, Any]) -> Dict[str, Any]:
     # Add to reasoning log
     state["reasoning_log"].append(f"🧠 DeepThink analysis of: \"{latest_message}\"")
     
-    # Create a prompt for the LLM to show token-by-token reasoning
+    # Obvious tool requests are decided locally, without calling the model
+    fast_path = fast_path_decision(latest_message)
+    if fast_path:
+        tool_name, args = fast_path
+        state["action"] = "use_tool"
+        state["tool_name"] = tool_name
+        state["tool_args"] = args
+        state["reasoning_log"].append(f"⚡ Fast path matched: {tool_name} with args: {args}")
+        add_thought(state, {
+            "phase": "decision_conclusion",
+            "thought": f"Final decision: {tool_name} (the request clearly matches this tool)"
+        })
+        state["full_reasoning"] = f"DECISION: {tool_name}\nARGS: {json.dumps(args)}"
+        return state
+    
+    # Create a prompt for the LLM to show token-by-token reasoning; the
+    # decision itself comes back as a native tool call
     messages = [
         {"role": "system", "content": """You are an assistant that demonstrates extremely detailed thinking.
         
          Think through this problem step-by-step, showing your thought process token by token. 
-         Your goal is to analyze whether the user's request requires any of these tools:
-         
-         - calculator: For mathematical calculations. Example: "What is 25 * 16?"
-         - get_current_time: To get the current date and time. Example: "What time is it?"
-         - get_weather: To check weather for a location. Example: "What's the weather in Paris?"
+         Your goal is to analyze whether the user's request requires any of the tools you can call.
          
          First, explain your thinking process in extreme detail, considering all aspects of the request.
          Break down the request into components, identify key terms, and consider possible interpretations.
          Think about whether this requires factual knowledge, calculation, or external data.
          
-         FORMAT YOUR RESPONSE AS FOLLOWS:
+         FORMAT YOUR THINKING AS FOLLOWS:
          STEP 1: [First thinking step]
          STEP 2: [Second thinking step]
          ...
          STEP N: [Final thinking step]
-         DECISION: [Your final decision: calculator, get_current_time, get_weather, or none]
          
-         If a tool is needed, also include:
-         ARGS: {"param_name": "value"}
+         Then call the tool the request needs. If no tool is needed, don't call any.
          
          Example thinking process for "What is 25 * 16?":
          STEP 1: The user is asking "What is 25 * 16?". This appears to be a mathematical question.
@@ -156,80 +629,123 @@ def deepthink_decision(state: Dict[str, Any]) -> Dict[str, Any]:
          STEP 3: This is clearly a request to perform multiplication between these two numbers.
          STEP 4: To perform mathematical calculations accurately, I should use the calculator tool.
          STEP 5: The calculator tool needs an expression to evaluate, which in this case is "25 * 16".
-         DECISION: calculator
-         ARGS: {"expression": "25 * 16"}
+         (then call calculator with expression "25 * 16")
          """},
         {"role": "user", "content": latest_message}
     ]
     
-    # Get detailed reasoning
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        temperature=0.2,  # Lower temperature for more deterministic reasoning
-    )
+    # Reuse the decision for a repeated or paraphrased request, otherwise
+    # get detailed reasoning
+    key = decision_key(latest_message)
+    decision = decision_cache.get(key)
+    recorded = 0
+    speculation = None
+    draft_task = None
+    if decision is not None:
+        state["reasoning_log"].append("⚡ Reusing the DeepThink analysis of an identical request")
+    else:
+        # Embed the message in the background. The decision only waits for it
+        # briefly, and only when the semantic cache could hold a match;
+        # otherwise the embedding is just stored afterwards. A failed or slow
+        # embedding is a cache miss, not a failed turn.
+        embed_task = asyncio.create_task(embed(latest_message))
+        if embedding_matrix is not None:
+            await asyncio.wait({embed_task}, timeout=SEMANTIC_LOOKUP_TIMEOUT)
+        vector = embedding_result(embed_task) if embed_task.done() else None
+        decision = semantic_lookup(vector, latest_message) if vector is not None else None
+        if decision is not None:
+            state["reasoning_log"].append("⚡ Reusing the DeepThink analysis of a similar request")
+        else:
+            # Start a tool the message hints at while the model decides
+            speculation = speculate_tool(latest_message)
+            
+            # Draft a direct response in the background while the decision
+            # streams in, so its steps are recorded as they arrive. Only the
+            # decision is awaited here; the draft is used or cancelled below.
+            draft_task = asyncio.create_task(client.chat.completions.create(**response_request(state)))
+            try:
+                reasoning, recorded, tool_call = await stream_steps({
+                    "model": DECISION_MODEL,
+                    "messages": messages,
+                    "tools": TOOL_SCHEMAS,
+                    "tool_choice": "auto",
+                    "temperature": 0.2,  # Lower temperature for more deterministic reasoning
+                    "max_tokens": 400,  # A few STEP lines and a tool call; bounds latency
+                }, state, "decision_making")
+            except BaseException:
+                draft_task.cancel()
+                embed_task.cancel()
+                raise
+            
+            decision = {"reasoning": reasoning, "tool_call": tool_call}
+            
+            # The embedding ran alongside the decision, so it is usually ready
+            try:
+                vector = await embed_task
+            except Exception:
+                vector = None
+            if vector is not None:
+                semantic_store(vector, decision)
+        decision_cache[key] = decision
     
-    reasoning = response.choices[0].message.content.strip()
+    reasoning, tool_call = decision["reasoning"], decision["tool_call"]
     
-    # Extract steps and decision
-    steps = re.findall(r"STEP \d+: (.*?)(?=STEP \d+:|DECISION:|$)", reasoning, re.DOTALL)
-    decision_match = re.search(r"DECISION: (.*?)(?=ARGS:|$)", reasoning, re.DOTALL)
-    args_match = re.search(r"ARGS: ({.*})", reasoning)
+    # Record each reasoning step not already recorded while streaming
+    steps = STEP_RE.findall(reasoning)
+    add_thoughts(state, step_entries(steps[recorded:], "decision_making", recorded + 1))
     
-    # Record each reasoning step with a brief pause to simulate thinking
-    for i, step in enumerate(steps):
-        step_content = step.strip()
-        state["deepthink_log"].append({
-            "phase": "decision_making",
-            "step": i+1,
-            "thought": step_content
-        })
-        # Simulate thinking time
-        time.sleep(0.1)
+    add_thought(state, {
+        "phase": "decision_conclusion",
+        "thought": f"Final decision: {tool_call['name'] if tool_call else 'none'}"
+    })
     
-    # Extract the decision
-    if decision_match:
-        decision = decision_match.group(1).strip().lower()
-        state["deepthink_log"].append({
-            "phase": "decision_conclusion",
-            "thought": f"Final decision: {decision}"
-        })
-        
-        # Determine action based on decision
-        if "calculator" in decision and args_match:
-            try:
-                args = json.loads(args_match.group(1))
-                state["action"] = "use_tool"
-                state["tool_name"] = "calculator"
-                state["tool_args"] = args
-                state["reasoning_log"].append(f"🧮 DeepThink decided to use calculator with args: {args}")
-            except json.JSONDecodeError:
-                state["action"] = "respond_directly"
-                state["reasoning_log"].append("⚠️ Couldn't parse calculator arguments, falling back to direct response")
-        
-        elif "get_current_time" in decision:
-            state["action"] = "use_tool"
-            state["tool_name"] = "get_current_time"
-            state["tool_args"] = {}
+    # Determine action based on the tool call, if any
+    args = None
+    if tool_call:
+        try:
+            args = json.loads(tool_call["arguments"] or "{}")
+        except json.JSONDecodeError:
+            state["reasoning_log"].append(f"⚠️ Couldn't parse {tool_call['name']} arguments, falling back to direct response")
+    
+    if tool_call is None:
+        state["action"] = "respond_directly"
+        state["reasoning_log"].append("💬 DeepThink decided to respond directly without using a tool")
+    elif args is None:
+        state["action"] = "respond_directly"
+    else:
+        state["action"] = "use_tool"
+        state["tool_name"] = tool_call["name"]
+        state["tool_args"] = args
+        if tool_call["name"] == "calculator":
+            state["reasoning_log"].append(f"🧮 DeepThink decided to use calculator with args: {args}")
+        elif tool_call["name"] == "get_current_time":
             state["reasoning_log"].append("🕒 DeepThink decided to get the current time")
-        
-        elif "get_weather" in decision and args_match:
-            try:
-                args = json.loads(args_match.group(1))
-                state["action"] = "use_tool"
-                state["tool_name"] = "get_weather"
-                state["tool_args"] = args
-                state["reasoning_log"].append(f"🌤️ DeepThink decided to get weather with args: {args}")
-            except json.JSONDecodeError:
-                state["action"] = "respond_directly"
-                state["reasoning_log"].append("⚠️ Couldn't parse weather arguments, falling back to direct response")
-        
         else:
-            state["action"] = "respond_directly"
-            state["reasoning_log"].append("💬 DeepThink decided to respond directly without using a tool")
-    else:
-        state["action"] = "respond_directly"
-        state["reasoning_log"].append("⚠️ No clear decision found, falling back to direct response")
+            state["reasoning_log"].append(f"🌤️ DeepThink decided to get weather with args: {args}")
+    
+    # Keep the speculative tool result if DeepThink chose that exact call,
+    # so use_tool finds it in the tool cache. It is stamped with the time the
+    # call started, so its age counts from then rather than from the decision.
+    if speculation:
+        spec_name, spec_args, started, future = speculation
+        spec_key = tool_cache_key(spec_name, spec_args)
+        if state["action"] == "use_tool" and tool_cache_key(state["tool_name"], state["tool_args"]) == spec_key:
+            tool_cache_put(spec_key, started, future.result())
+            state["reasoning_log"].append(f"⚡ Speculative {spec_name} call confirmed")
+        else:
+            future.cancel()
+    
+    # Keep the draft only when no tool is needed. A failed draft just means
+    # thinking_response makes the usual response call.
+    if draft_task:
+        if state["action"] == "use_tool":
+            draft_task.cancel()
+        else:
+            try:
+                draft = await draft_task
+                state["draft_response"] = draft.choices[0].message.content.strip()
+            except Exception:
+                state["reasoning_log"].append("⚠️ The drafted response failed, generating it again")
     
     # Store complete reasoning for reference
     state["full_reasoning"] = reasoning
@@ -243,45 +759,55 @@ def use_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     tool_name = state["tool_name"]
     tool_args = state["tool_args"]
-    result = None
     
     # Add to reasoning log
     state["reasoning_log"].append(f"🛠️ Executing tool: {tool_name}")
-    state["deepthink_log"].append({
+    add_thought(state, {
         "phase": "tool_execution",
         "thought": f"Now executing the {tool_name} tool with parameters: {tool_args}"
     })
     
-    # Execute the requested tool
-    if tool_name == "calculator" and "expression" in tool_args:
-        state["deepthink_log"].append({
+    # Reuse a recent result of the same call, otherwise execute the requested tool
+    key = tool_cache_key(tool_name, tool_args)
+    result = tool_cache_get(key)
+    if result is not None:
+        add_thought(state, {
             "phase": "tool_execution",
-            "thought": f"Calculating expression: {tool_args['expression']}"
-        })
-        result = calculator(tool_args["expression"])
-    elif tool_name == "get_current_time":
-        state["deepthink_log"].append({
-            "phase": "tool_execution",
-            "thought": "Retrieving the current system time"
-        })
-        result = get_current_time()
-    elif tool_name == "get_weather" and "location" in tool_args:
-        state["deepthink_log"].append({
-            "phase": "tool_execution", 
-            "thought": f"Checking weather information for location: {tool_args['location']}"
+            "thought": "Reusing the result of an identical recent call"
         })
-        result = get_weather(tool_args["location"])
     else:
-        result = f"Error: Invalid tool '{tool_name}' or missing required arguments"
-        state["deepthink_log"].append({
-            "phase": "tool_execution",
-            "thought": f"Error executing tool: {result}"
-        })
+        if tool_name == "calculator" and "expression" in tool_args:
+            add_thought(state, {
+                "phase": "tool_execution",
+                "thought": f"Calculating expression: {tool_args['expression']}"
+            })
+            result = calculator(tool_args["expression"])
+        elif tool_name == "get_current_time":
+            add_thought(state, {
+                "phase": "tool_execution",
+                "thought": "Retrieving the current system time"
+            })
+            result = get_current_time()
+        elif tool_name == "get_weather" and "location" in tool_args:
+            add_thought(state, {
+                "phase": "tool_execution", 
+                "thought": f"Checking weather information for location: {tool_args['location']}"
+            })
+            result = get_weather(tool_args["location"])
+        else:
+            result = f"Error: Invalid tool '{tool_name}' or missing required arguments"
+            add_thought(state, {
+                "phase": "tool_execution",
+                "thought": f"Error executing tool: {result}"
+            })
+        
+        if not result.startswith("Error"):
+            tool_cache_put(key, time.monotonic(), result)
     
     # Store the result
     state["tool_result"] = result
     state["reasoning_log"].append(f"✅ Tool result: {result}")
-    state["deepthink_log"].append({
+    add_thought(state, {
         "phase": "tool_result",
         "thought": f"Tool execution complete. Result: {result}"
     })
@@ -292,78 +818,30 @@ def use_tool(state: Dict[str, Any]) -> Dict[str, Any]:
     return state
 
 
-def deepthink_response(state: Dict[str, Any]) -> Dict[str, Any]:
+async def deepthink_response(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     Generate a final response with detailed reasoning.
     """
     # Add to reasoning log
     state["reasoning_log"].append("🧠 DeepThink generating final response")
-    state["deepthink_log"].append({
+    add_thought(state, {
         "phase": "response_generation",
         "thought": "Now I need to formulate a complete response based on all available information"
     })
     
-    # Prepare messages for the API call
-    if state.get("action") == "use_tool":
-        # If we used a tool, include a special system message
-        system_message = f"""You are a helpful assistant with strong reasoning abilities.
-        
-        The user asked: "{state["history"][0]["content"]}"
-        
-        You used the {state["tool_name"]} tool, which returned: "{state["tool_result"]}"
-        
-        Now explain your thought process step by step for formulating a response based on this tool result.
-        Think about how to present this information clearly and helpfully.
-        
-        FORMAT YOUR RESPONSE AS FOLLOWS:
-        STEP 1: [First reasoning step]
-        STEP 2: [Second reasoning step]
-        ...
-        FINAL RESPONSE: [The actual response to give to the user]
-        """
-    else:
-        # For direct responses
-        system_message = f"""You are a helpful assistant with strong reasoning abilities.
-        
-        The user asked: "{state["history"][0]["content"]}"
-        
-        Think step by step about how to respond to this request without using any external tools.
-        Consider what information you already know that can help answer this question.
-        
-        FORMAT YOUR RESPONSE AS FOLLOWS:
-        STEP 1: [First reasoning step]
-        STEP 2: [Second reasoning step]
-        ...
-        FINAL RESPONSE: [The actual response to give to the user]
-        """
-    
-    messages = [
-        {"role": "system", "content": system_message}
-    ]
-    
-    # Get response with reasoning
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        temperature=0.7,  # Higher temperature for more creative responses
-    )
-    
-    full_response = response.choices[0].message.content.strip()
+    # Use the response drafted alongside the decision when no tool was needed,
+    # otherwise get response with reasoning
+    full_response = state.pop("draft_response", None)
+    recorded = 0
+    if state.get("action") == "use_tool" or full_response is None:
+        full_response, recorded, _ = await stream_steps(response_request(state), state, "response_formulation")
     
     # Extract steps and final response
-    steps = re.findall(r"STEP \d+: (.*?)(?=STEP \d+:|FINAL RESPONSE:|$)", full_response, re.DOTALL)
-    final_match = re.search(r"FINAL RESPONSE: (.*)", full_response, re.DOTALL)
-    
-    # Record each response reasoning step
-    for i, step in enumerate(steps):
-        step_content = step.strip()
-        state["deepthink_log"].append({
-            "phase": "response_formulation",
-            "step": i+1,
-            "thought": step_content
-        })
-        # Simulate thinking time
-        time.sleep(0.1)
+    steps = STEP_RE.findall(full_response)
+    final_match = FINAL_RESPONSE_RE.search(full_response)
+    
+    # Record each response reasoning step not already recorded while streaming
+    add_thoughts(state, step_entries(steps[recorded:], "response_formulation", recorded + 1))
     
     # Extract the final response
     if final_match:
@@ -374,7 +852,7 @@ def deepthink_response(state: Dict[str, Any]) -> Dict[str, Any]:
     
     state["response"] = assistant_message
     state["reasoning_log"].append(f"🤖 Final response: {assistant_message}")
-    state["deepthink_log"].append({
+    add_thought(state, {
         "phase": "final_output",
         "thought": f"Delivering final response to user: {assistant_message}"
     })
@@ -428,10 +906,25 @@ def build_graph() -> StateGraph:
     return graph
 
 
+@lru_cache(maxsize=1)
+def get_compiled_graph():
+    """
+    Build and compile the agent graph on first use, then return the same
+    compiled graph to every caller (e.g. each request when served as a library).
+    """
+    return build_graph().compile()
+
+
+# Number of characters the typing effect writes at a time
+TYPING_CHUNK = 4
+
+
 def display_deepthink(log, thinking_speed=0.05):
     """
     Display the DeepThink process with a typing effect.
     """
+    write, flush = sys.stdout.write, sys.stdout.flush
+    
     for entry in log:
         phase = entry["phase"]
         
@@ -455,27 +948,72 @@ def display_deepthink(log, thinking_speed=0.05):
         elif phase == "final_output":
             print("\n📝 FINAL RESPONSE:", end=" ")
         
-        # Display the thought with a typing effect
+        # Display the thought with a typing effect, a few characters per write
+        # so the terminal isn't flushed once per character
         thought = entry["thought"]
-        for char in thought:
-            print(char, end="", flush=True)
-            time.sleep(thinking_speed)
+        for i in range(0, len(thought), TYPING_CHUNK):
+            write(thought[i:i + TYPING_CHUNK])
+            flush()
+            time.sleep(thinking_speed * TYPING_CHUNK)
         print()
 
 
-def main():
+# Places named in the conversation ("... in Paris"), and the most follow-up
+# weather lookups prefetched in one session. Only messages about the weather
+# are searched for places, since "talked to Bob" or "in January" would also
+# match, and day and month names are never taken for places.
+PLACE_RE = re.compile(r"\b(?:in|for|at|to|from) ([A-Z][\w'-]*(?: [A-Z][\w'-]*)*)")
+WEATHER_TOPIC_RE = re.compile(r"\b(?:weather|forecast|temperature|rain\w*|snow\w*|sunny|cloudy|windy|umbrella)\b",
+                              re.IGNORECASE)
+NOT_PLACES = frozenset(name for name in (*calendar.day_name, *calendar.month_name) if name)
+PREFETCH_LIMIT = 3
+
+
+def predict_tool_calls(state: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Predict the tool calls the user's next request is likely to need.
+    
+    After a weather lookup, the user often asks about the other places they
+    have mentioned, so their weather is predicted unless it is already cached.
+    """
+    if state.get("tool_name") != "get_weather":
+        return []
+    
+    calls = {}
+    for message in state["history"]:
+        if message["role"] != "user" or not WEATHER_TOPIC_RE.search(message["content"]):
+            continue
+        for place in PLACE_RE.findall(message["content"]):
+            if place in NOT_PLACES:
+                continue
+            call = ("get_weather", {"location": place})
+            key = tool_cache_key(*call)
+            if key not in calls and tool_cache_get(key) is None:
+                calls[key] = call
+    return list(calls.values())
+
+
+def prefetch_tool_calls(calls: List[Tuple[str, Dict[str, Any]]]):
+    """
+    Run tool calls ahead of time and store their results in the tool cache.
+    """
+    for tool_name, tool_args in calls:
+        started = time.monotonic()
+        result = TOOL_FUNCTIONS[tool_name](**tool_args)
+        tool_cache_put(tool_cache_key(tool_name, tool_args), started, result)
+
+
+# State keys that only describe a single turn
+TURN_KEYS = ("action", "tool_name", "tool_args", "tool_result", "response",
+             "full_reasoning", "draft_response", "on_thought")
+
+
+async def main():
     """Run the LangGraph agent with DeepThink reasoning."""
     print("\n--- LangGraph Agent with DeepThink Reasoning ---\n")
     
-    # Check if OpenAI API key is set
-    if not os.getenv("OPENAI_API_KEY"):
-        print("Error: OPENAI_API_KEY not found in environment variables.")
-        print("Please set it in a .env file or export it to your environment.")
-        return
-    
-    # Build and compile the graph
-    graph = build_graph()
-    compiled_graph = graph.compile()
+    # Get the shared compiled graph
+    compiled_graph = get_compiled_graph()
     
     # Initialize conversation history
     state = {"history": [], "reasoning_log": [], "deepthink_log": []}
@@ -490,6 +1028,7 @@ def main():
     
     show_deepthink = False
     thinking_speed = 0.01  # Default speed (seconds per character)
+    prefetch_slots = PREFETCH_LIMIT
     
     while True:
         # Get user input
@@ -518,24 +1057,37 @@ def main():
             print("DeepThink speed decreased for more dramatic effect.")
             continue
             
-        # Prepare state for this turn
-        current_state = state.copy()
-        current_state["input"] = user_input
+        # Prepare the state for this turn in place: the history carries over,
+        # everything else from the previous turn is cleared
+        state["input"] = user_input
+        for key in TURN_KEYS:
+            state.pop(key, None)
+        state["reasoning_log"].clear()
+        state["deepthink_log"].clear()
+        
+        # Show DeepThink reasoning if enabled, each entry as soon as it is recorded
+        if show_deepthink:
+            state["on_thought"] = lambda entry: display_deepthink([entry], thinking_speed)
         
         # Run the graph
-        result = compiled_graph.invoke(current_state)
+        result = await compiled_graph.ainvoke(state)
         
-        # Update the persistent state with new history
+        # Keep the history the graph ended with
         state["history"] = result["history"]
         
-        # Show DeepThink reasoning if enabled
         if show_deepthink:
-            display_deepthink(result["deepthink_log"], thinking_speed)
             print("\n" + "-" * 80)
         
         # Display the response
         print(f"\nAgent: {result['response']}")
+        
+        # While the user reads and types, prefetch what the next request
+        # will likely need, up to PREFETCH_LIMIT calls per session
+        calls = predict_tool_calls(result)[:prefetch_slots]
+        if calls:
+            prefetch_slots -= len(calls)
+            threading.Thread(target=prefetch_tool_calls, args=(calls,), daemon=True).start()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
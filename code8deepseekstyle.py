@@ -8,21 +8,188 @@ to show its reasoning process in a style similar to DeepSeek models.
 """
 
 import os
-import json
+import sys
+import orjson
 import datetime
-import re
 import math
+import ast
+import operator
+import random
 import time
-from typing import Dict, Any, List, Literal
+import hashlib
+import asyncio
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Any, List, Literal, Optional, Tuple, Callable, TypedDict
+from diskcache import Cache
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
 
 # Load environment variables from .env file (for API keys)
 load_dotenv()
 
-# Initialize OpenAI client
+# Read the API key once at import and fail fast if it is missing, before any
+# client or graph is built.
+API_KEY = os.getenv("OPENAI_API_KEY")
+if not API_KEY:
+    sys.exit("Error: OPENAI_API_KEY not found in environment variables.\n"
+             "Please set it in a .env file or export it to your environment.")
+
+# Initialize the async OpenAI client, so that independent turns (see
+# batch_main) can wait on the API concurrently
 import openai
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = openai.AsyncOpenAI(api_key=API_KEY)
+
+# On-disk cache of completions, keyed on the model, temperature and exact
+# messages sent. Only near-deterministic calls (the tool decision) are cached;
+# the more creative final response is always generated fresh. Entries expire
+# after CACHE_TTL seconds, so stale reasoning does not live forever.
+response_cache = Cache("./.llm_cache")
+CACHE_MAX_TEMPERATURE = 0.2
+CACHE_TTL = 7 * 24 * 60 * 60
+
+
+def cache_key(request: Dict[str, Any]) -> str:
+    """
+    Build the response-cache key for a chat request.
+    
+    The request (model, temperature, messages and tools) is serialized with
+    sorted keys and no whitespace so that equal requests always hash to the same key.
+    """
+    return hashlib.sha256(orjson.dumps(request, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+async def cached_completion(messages: List[Dict[str, Any]], model: str, temperature: float,
+                            tools: Optional[List[Dict[str, Any]]] = None,
+                            on_delta: Optional[Callable[[str], None]] = None,
+                            on_tool_call: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Return the reply to a chat request, reusing a cached reply when possible.
+    
+    The reply is streamed, so that callers can act on it before it is complete.
+    
+    Args:
+        messages: The messages to send
+        model: The chat model to use
+        temperature: Sampling temperature; only requests at or below
+            CACHE_MAX_TEMPERATURE are cached
+        tools: Tool schemas the model may call, several at once
+        on_delta: Called with each piece of the reply text as it arrives
+            (with the whole text at once when it comes from the cache)
+        on_tool_call: Called with each tool call as soon as it is complete
+        
+    Returns:
+        The assistant message: its stripped "content" and, if the model
+        called any tools, its "tool_calls"
+    """
+    request = {"model": model, "messages": messages, "temperature": temperature}
+    if tools:
+        request.update(tools=tools, tool_choice="auto", parallel_tool_calls=True)
+    
+    cacheable = temperature <= CACHE_MAX_TEMPERATURE
+    if cacheable:
+        key = cache_key(request)
+        message = response_cache.get(key)
+        if message is not None:
+            if on_delta and message["content"]:
+                on_delta(message["content"])
+            for call in message.get("tool_calls", []) if on_tool_call else []:
+                on_tool_call(call)
+            return message
+    
+    stream = await client.chat.completions.create(**request, stream=True)
+    chunks = []
+    tool_calls = []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        
+        # Tool calls arrive in pieces, one call after the other
+        for piece in delta.tool_calls or []:
+            while piece.index >= len(tool_calls):
+                # A new call begins, so the one before it is complete
+                if tool_calls and on_tool_call:
+                    on_tool_call(tool_calls[-1])
+                tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+            call = tool_calls[piece.index]
+            call["id"] += piece.id or ""
+            if piece.function:
+                call["function"]["name"] += piece.function.name or ""
+                call["function"]["arguments"] += piece.function.arguments or ""
+        
+        if delta.content:
+            chunks.append(delta.content)
+            if on_delta:
+                on_delta(delta.content)
+    if tool_calls and on_tool_call:
+        on_tool_call(tool_calls[-1])
+    
+    message = {"role": "assistant", "content": "".join(chunks).strip()}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    
+    if cacheable:
+        response_cache.set(key, message, expire=CACHE_TTL)
+    return message
+
+
+# Math functions and constants the calculator may use, built once at import
+ALLOWED_NAMES = {
+    k: v for k, v in math.__dict__.items()
+    if not k.startswith('__')
+}
+
+
+# Arithmetic operators the calculator supports
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+
+@lru_cache(maxsize=512)
+def parse_expression(expression: str) -> ast.expr:
+    """
+    Parse an expression into its syntax tree. Repeated expressions reuse the tree.
+    """
+    return ast.parse(expression, mode="eval").body
+
+
+def evaluate(node: ast.expr) -> Any:
+    """
+    Evaluate a parsed arithmetic expression.
+    
+    Only numbers, the operators in OPERATORS and the names in ALLOWED_NAMES
+    are accepted, so unlike eval() this cannot run arbitrary code.
+    
+    Args:
+        node: A node of the parsed expression
+        
+    Returns:
+        The value of the expression
+    """
+    node_type = type(node)
+    
+    if node_type is ast.Constant and type(node.value) in (int, float, complex):
+        return node.value
+    if node_type is ast.BinOp and type(node.op) in OPERATORS:
+        return OPERATORS[type(node.op)](evaluate(node.left), evaluate(node.right))
+    if node_type is ast.UnaryOp and type(node.op) in OPERATORS:
+        return OPERATORS[type(node.op)](evaluate(node.operand))
+    if node_type is ast.Name and node.id in ALLOWED_NAMES:
+        return ALLOWED_NAMES[node.id]
+    if (node_type is ast.Call and type(node.func) is ast.Name
+            and node.func.id in ALLOWED_NAMES and not node.keywords):
+        return ALLOWED_NAMES[node.func.id](*[evaluate(arg) for arg in node.args])
+    
+    raise ValueError(f"unsupported expression '{ast.unparse(node)}'")
 
 
 # Define tools that our agent can use
@@ -37,14 +204,8 @@ def calculator(expression: str) -> str:
         The result of the calculation
     """
     try:
-        # Use safer eval with math functions
-        allowed_names = {
-            k: v for k, v in math.__dict__.items() 
-            if not k.startswith('__')
-        }
-        
-        # Evaluate the expression
-        result = eval(expression, {"__builtins__": {}}, allowed_names)
+        # Walk the parsed expression instead of eval()-ing it
+        result = evaluate(parse_expression(expression))
         return f"Result of {expression} = {result}"
     except Exception as e:
         return f"Error evaluating expression: {str(e)}"
@@ -57,8 +218,12 @@ def get_current_time() -> str:
     Returns:
         A string with the current date and time
     """
-    now = datetime.datetime.now()
-    return f"Current time: {now.strftime('%Y-%m-%d %H:%M:%S')}"
+    # Same "YYYY-MM-DD HH:MM:SS" text as strftime, without parsing a format string
+    return f"Current time: {datetime.datetime.now().isoformat(' ', 'seconds')}"
+
+
+# Possible conditions for the simulated weather, built once
+WEATHERS = ("sunny", "cloudy", "rainy", "snowy", "windy")
 
 
 def get_weather(location: str) -> str:
@@ -72,247 +237,463 @@ def get_weather(location: str) -> str:
         Weather information for the specified location
     """
     # This is a mock implementation - in a real app, you would call a weather API
-    weathers = ["sunny", "cloudy", "rainy", "snowy", "windy"]
-    temps = range(0, 35)
-    
-    import random
-    weather = random.choice(weathers)
-    temp = random.choice(temps)
+    weather = WEATHERS[random.randrange(len(WEATHERS))]
+    temp = random.randrange(35)
     
     return f"Weather in {location}: {weather} with a temperature of {temp}°C"
 
 
-# Define states and functions for our agent
-def process_input(state: Dict[str, Any]) -> Dict[str, Any]:
+# Markers of the reply format. Replies are picked apart with str.find in a
+# single pass instead of one regex search per part.
+THINKING_OPEN = "<Thinking>"
+THINKING_CLOSE = "</Thinking>"
+
+
+def split_thinking(text: str) -> Tuple[Optional[str], Optional[str]]:
     """
-    Process user input and add it to conversation history.
+    Split a model reply into its <Thinking> block and the text after it.
+    
+    Args:
+        text: The full reply
+        
+    Returns:
+        The stripped thinking, or None if there is no complete block, and
+        the text after </Thinking>, or None if the closing tag is missing
+    """
+    close = text.find(THINKING_CLOSE)
+    if close == -1:
+        return None, None
+    
+    start = text.rfind(THINKING_OPEN, 0, close)
+    thinking = text[start + len(THINKING_OPEN):close].strip() if start != -1 else None
+    return thinking, text[close + len(THINKING_CLOSE):]
+
+
+# Colored opening tag for each type of thinking token, and the closing tag
+THINKING_HEADERS = {
+    "decision": "\n\033[1;36m<Thinking>\033[0m",        # Cyan, bold
+    "tool_execution": "\n\033[1;33m<Thinking>\033[0m",  # Yellow, bold
+    "tool_result": "\n\033[1;32m<Thinking>\033[0m",     # Green, bold
+    "response": "\n\033[1;35m<Thinking>\033[0m",        # Magenta, bold
+}
+THINKING_FOOTER = "\n\033[1m</Thinking>\033[0m"  # Bold
+
+
+class ThinkingPrinter:
     """
-    # Initialize history if it doesn't exist
-    if "history" not in state:
-        state["history"] = []
+    Print the <Thinking> block of a reply while the reply is streamed in.
     
-    # Initialize thinking tokens if it doesn't exist
-    if "thinking_tokens" not in state:
-        state["thinking_tokens"] = []
+    Text is written as soon as it cannot be part of the closing tag, so the
+    thinking appears at the rhythm the model generates it.
+    """
+    
+    def __init__(self, token_type: str):
+        self.header = THINKING_HEADERS[token_type]
+        self.text = ""
+        self.printed = -1  # End of the text handled so far; -1 until <Thinking> arrives
+        self.wrote = False
+        self.done = False
+    
+    def feed(self, delta: str):
+        """Take the next piece of the reply and print any new thinking in it."""
+        if self.done:
+            return
+        self.text += delta
+        
+        if self.printed == -1:
+            start = self.text.find(THINKING_OPEN)
+            if start == -1:
+                return
+            print(self.header)
+            self.printed = start + len(THINKING_OPEN)
+        
+        close = self.text.find(THINKING_CLOSE, self.printed)
+        if close != -1:
+            end = close
+            chunk = self.text[self.printed:end].rstrip()
+        else:
+            # Hold back what may be the start of the closing tag, and trailing
+            # whitespace that may turn out to precede it
+            end = max(self.printed, len(self.text) - len(THINKING_CLOSE) + 1)
+            chunk = self.text[self.printed:end].rstrip()
+            end = self.printed + len(chunk)
+        
+        if not self.wrote:
+            chunk = chunk.lstrip()
+        if chunk:
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+            self.wrote = True
+        self.printed = end
+        
+        if close != -1:
+            print(THINKING_FOOTER)
+            self.done = True
+    
+    def finish(self):
+        """Close a block that the reply left open."""
+        if self.printed != -1 and not self.done:
+            print(THINKING_FOOTER)
+            self.done = True
+
+
+# Define states and functions for our agent
+@dataclass(slots=True, frozen=True)
+class ThinkingToken:
+    """A piece of the agent's reasoning, shown under the header for its type."""
+    type: str
+    content: str
+
+
+class AgentState(TypedDict):
+    """
+    State passed between the nodes of the agent graph.
     
-    # Get user input
-    user_input = state.get("input", "")
+    Every field is present from the start (see new_state), so the nodes
+    read them directly instead of checking for and initializing missing keys.
+    """
+    input: str
+    history: List[Dict[str, Any]]
+    user_messages: List[Dict[str, Any]]
+    thinking_tokens: List[ThinkingToken]
+    stream_thinking: bool
+    action: str
+    tool_calls: List[Dict[str, Any]]
+    started_tools: Dict[str, asyncio.Task]
+    tool_results: List[Dict[str, Any]]
+    response: str
+
+
+def new_state(user_input: str, history: List[Dict[str, Any]], user_messages: List[Dict[str, Any]],
+              stream_thinking: bool = False) -> AgentState:
+    """
+    Build the state for one turn of the conversation.
     
-    # Add user message to history
-    state["history"].append({"role": "user", "content": user_input})
+    Args:
+        user_input: The user's message for this turn
+        history: The conversation so far; it is copied, since the nodes
+            append to it in place
+        user_messages: The user's messages so far; copied likewise
+        stream_thinking: Whether to show the thinking live as it is generated
+        
+    Returns:
+        A state with every field set
+    """
+    return {
+        "input": user_input,
+        "history": list(history),
+        "user_messages": list(user_messages),
+        "thinking_tokens": [],
+        "stream_thinking": stream_thinking,
+        "action": "",
+        "tool_calls": [],
+        "started_tools": {},
+        "tool_results": [],
+        "response": "",
+    }
+
+
+def add_thinking_token(state: AgentState, token_type: str, content: str, shown: bool = False):
+    """
+    Add a thinking token to the state, and show it right away when the
+    thinking is streamed to the terminal (unless it was already shown).
+    """
+    token = ThinkingToken(token_type, content)
+    state["thinking_tokens"].append(token)
+    if state["stream_thinking"] and not shown:
+        display_thinking_tokens([token])
+
+
+def process_input(state: AgentState) -> AgentState:
+    """
+    Process user input and add it to conversation history.
+    """
+    # Add user message to history, and to the user-only messages that the
+    # response call sends
+    user_message = {"role": "user", "content": state["input"]}
+    state["history"].append(user_message)
+    state["user_messages"].append(user_message)
     
     return state
 
 
-def thinking_decision(state: Dict[str, Any]) -> Dict[str, Any]:
+# System message for the decision. It has no per-turn parts, so it is built
+# once at import.
+DECISION_SYSTEM_MESSAGE = {"role": "system", "content": """You are an assistant that demonstrates your reasoning with <Thinking> tokens.
+
+For the user's request, use <Thinking> tags to show your detailed reasoning process,
+then call any of the provided tools that the request requires. If it needs several
+(e.g. "What's the weather in Paris and the time?"), call all of them at once; they
+will run at the same time. If it needs none, call no tool.
+
+Your reasoning should follow this format:
+
+<Thinking>
+First, let me analyze what the user is asking for...
+[Your detailed reasoning about the problem]
+
+Based on my analysis, I need to... [explain your decision]
+</Thinking>"""}
+
+# Schemas of the tools the decision may call
+TOOL_SCHEMAS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "calculator",
+            "description": "Evaluate a mathematical expression.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "expression": {"type": "string", "description": "The expression to evaluate, e.g. 25 * 16"},
+                },
+                "required": ["expression"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_current_time",
+            "description": "Get the current date and time.",
+            "parameters": {"type": "object", "properties": {}},
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "description": "Get the current weather for a location.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "location": {"type": "string", "description": "City or location to check"},
+                },
+                "required": ["location"],
+            },
+        },
+    },
+]
+
+# The arguments each tool requires
+TOOL_REQUIRED_ARGS = {
+    "calculator": ("expression",),
+    "get_current_time": (),
+    "get_weather": ("location",),
+}
+
+
+def parse_tool_call(call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Check a tool call made by the model and decode its arguments.
+    
+    Args:
+        call: The tool call, as in the assistant message
+        
+    Returns:
+        The call's id, tool name and arguments, or None if it is not a call
+        to a known tool with its required arguments
+    """
+    tool_name = call["function"]["name"]
+    try:
+        tool_args = orjson.loads(call["function"]["arguments"] or "{}")
+    except orjson.JSONDecodeError:
+        return None
+    if tool_name in TOOL_REQUIRED_ARGS and isinstance(tool_args, dict) \
+            and all(arg in tool_args for arg in TOOL_REQUIRED_ARGS[tool_name]):
+        return {"id": call["id"], "name": tool_name, "args": tool_args}
+    return None
+
+
+async def thinking_decision(state: AgentState) -> AgentState:
     """
     Analyze the request and decide on an action using DeepSeek-style thinking tokens.
+    
+    The model calls the tools it needs natively, and may call several, e.g.
+    for "What's the weather in Paris and the time?", so that they all run in
+    the same turn.
     """
     # Access the latest user message
-    latest_message = state["history"][-1]["content"]
+    history = state["history"]
+    latest_message = history[-1]["content"]
     
-    # Create a prompt for the LLM to decide with thinking tokens
+    # Ask the LLM to decide with thinking tokens
     messages = [
-        {"role": "system", "content": """You are an assistant that demonstrates your reasoning with <Thinking> tokens.
-        
-         For the user's request, use <Thinking> tags to show your detailed reasoning process,
-         then decide if the request requires any of these tools:
-         
-         - calculator: For mathematical calculations. Example: "What is 25 * 16?"
-         - get_current_time: To get the current date and time. Example: "What time is it?"
-         - get_weather: To check weather for a location. Example: "What's the weather in Paris?"
-         
-         Your response should follow this format:
-         
-         <Thinking>
-         First, let me analyze what the user is asking for...
-         [Your detailed reasoning about the problem]
-         
-         Based on my analysis, I need to... [explain your decision]
-         </Thinking>
-         
-         TOOL: [tool_name or "none"]
-         ARGS: [arguments in JSON format if needed]
-         
-         Example:
-         <Thinking>
-         The user is asking "What is 25 * 16?". This is clearly a mathematical calculation.
-         I need to multiply 25 by 16, which requires the calculator tool.
-         The input to the calculator should be the expression "25 * 16".
-         </Thinking>
-         
-         TOOL: calculator
-         ARGS: {"expression": "25 * 16"}
-         """},
+        DECISION_SYSTEM_MESSAGE,
         {"role": "user", "content": latest_message}
     ]
     
-    # Get the thinking and decision
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        temperature=0.2,  # Lower temperature for more deterministic reasoning
+    # Print the thinking as it streams in, if it is shown
+    printer = ThinkingPrinter("decision") if state["stream_thinking"] else None
+    started_tools = state["started_tools"] = {}
+    
+    def on_tool_call(call: Dict[str, Any]):
+        # Start each tool as soon as its call is complete, while the rest of
+        # the reply is still arriving
+        tool_call = parse_tool_call(call)
+        if tool_call:
+            started_tools[tool_call["id"]] = asyncio.create_task(
+                asyncio.to_thread(run_tool, tool_call["name"], tool_call["args"])
+            )
+    
+    # Get the thinking and decision. The low temperature makes the reasoning
+    # near-deterministic, so an identical request is answered from the cache.
+    reply = await cached_completion(
+        messages, model="gpt-4", temperature=0.2, tools=TOOL_SCHEMAS,
+        on_delta=printer.feed if printer else None, on_tool_call=on_tool_call,
     )
-    
-    full_response = response.choices[0].message.content.strip()
+    if printer:
+        printer.finish()
     
     # Extract thinking part
-    thinking_match = re.search(r"<Thinking>(.*?)</Thinking>", full_response, re.DOTALL)
-    if thinking_match:
-        thinking = thinking_match.group(1).strip()
-        state["thinking_tokens"].append({
-            "type": "decision",
-            "content": thinking
-        })
-    
-    # Extract tool decision
-    tool_match = re.search(r"TOOL: (\w+)", full_response)
-    args_match = re.search(r"ARGS: ({.*})", full_response)
-    
-    if tool_match:
-        tool_name = tool_match.group(1).strip().lower()
-        
-        if tool_name == "calculator" and args_match:
-            try:
-                args = json.loads(args_match.group(1))
-                state["action"] = "use_tool"
-                state["tool_name"] = "calculator"
-                state["tool_args"] = args
-            except json.JSONDecodeError:
-                state["action"] = "respond_directly"
-        
-        elif tool_name == "get_current_time":
-            state["action"] = "use_tool"
-            state["tool_name"] = "get_current_time"
-            state["tool_args"] = {}
-        
-        elif tool_name == "get_weather" and args_match:
-            try:
-                args = json.loads(args_match.group(1))
-                state["action"] = "use_tool"
-                state["tool_name"] = "get_weather"
-                state["tool_args"] = args
-            except json.JSONDecodeError:
-                state["action"] = "respond_directly"
-        
-        elif tool_name == "none":
-            state["action"] = "respond_directly"
-        
-        else:
-            state["action"] = "respond_directly"
-    else:
-        state["action"] = "respond_directly"
+    thinking, _ = split_thinking(reply["content"])
+    if thinking is not None:
+        add_thinking_token(state, "decision", thinking, shown=printer is not None)
+    
+    # Keep the calls to known tools that come with their required arguments
+    tool_calls = [call for call in map(parse_tool_call, reply.get("tool_calls", [])) if call]
+    
+    state["tool_calls"] = tool_calls
+    state["action"] = "use_tool" if tool_calls else "respond_directly"
     
     return state
 
 
-def use_tool(state: Dict[str, Any]) -> Dict[str, Any]:
-    """
-    Execute the selected tool and capture the result.
+def run_tool(tool_name: str, tool_args: Dict[str, Any]) -> str:
     """
-    tool_name = state["tool_name"]
-    tool_args = state["tool_args"]
-    result = None
-    
-    # Add to thinking tokens
-    state["thinking_tokens"].append({
-        "type": "tool_execution",
-        "content": f"Now I'll use the {tool_name} tool with these parameters: {tool_args}"
-    })
+    Execute a tool with the given arguments.
     
-    # Execute the requested tool
+    Args:
+        tool_name: The name of the tool to run
+        tool_args: The arguments chosen for it
+        
+    Returns:
+        The tool's result, or an error message starting with "Error"
+    """
     if tool_name == "calculator" and "expression" in tool_args:
-        result = calculator(tool_args["expression"])
+        return calculator(tool_args["expression"])
     elif tool_name == "get_current_time":
-        result = get_current_time()
+        return get_current_time()
     elif tool_name == "get_weather" and "location" in tool_args:
-        result = get_weather(tool_args["location"])
+        return get_weather(tool_args["location"])
     else:
-        result = f"Error: Invalid tool '{tool_name}' or missing required arguments"
-    
-    # Store the result
-    state["tool_result"] = result
-    
-    # Add to thinking tokens
-    state["thinking_tokens"].append({
-        "type": "tool_result",
-        "content": f"The {tool_name} tool returned: {result}"
-    })
-    
-    # Add to history as a function message
-    state["history"].append({"role": "function", "name": tool_name, "content": result})
-    
-    return state
+        return f"Error: Invalid tool '{tool_name}' or missing required arguments"
 
 
-def thinking_response(state: Dict[str, Any]) -> Dict[str, Any]:
+async def use_tool(state: AgentState) -> AgentState:
     """
-    Generate a final response with DeepSeek-style thinking tokens.
+    Execute the selected tools concurrently, each on a worker thread, and
+    capture their results.
+    
+    Tools that the decision already started while it was streaming are not
+    run again.
     """
-    # Prepare messages for the API call
-    if state.get("action") == "use_tool":
-        # If we used a tool, include the tool result
-        system_message = f"""You are a helpful assistant that demonstrates reasoning with <Thinking> tokens.
+    tool_calls = state["tool_calls"]
+    for call in tool_calls:
+        # Add to thinking tokens
+        add_thinking_token(state, "tool_execution",
+                           f"Now I'll use the {call['name']} tool with these parameters: {call['args']}")
+    
+    started = state["started_tools"]
+    results = await asyncio.gather(*(
+        started.get(call["id"]) or asyncio.to_thread(run_tool, call["name"], call["args"])
+        for call in tool_calls
+    ))
+    
+    history = state["history"]
+    tool_results = state["tool_results"] = []
+    for call, result in zip(tool_calls, results):
+        tool_name = call["name"]
         
-        The user asked: "{state["history"][0]["content"]}"
+        # Store the result
+        tool_results.append({"name": tool_name, "args": call["args"], "result": result})
         
-        You used the {state["tool_name"]} tool, which returned: "{state["tool_result"]}"
+        # Add to thinking tokens
+        add_thinking_token(state, "tool_result", f"The {tool_name} tool returned: {result}")
         
-        First use <Thinking> tags to show your reasoning process, then provide your final answer.
-        
-        Format:
-        <Thinking>
-        [Your detailed reasoning about how to interpret the tool result and formulate a response]
-        </Thinking>
+        # Add to history as a function message
+        history.append({"role": "function", "name": tool_name, "content": result})
+    
+    return state
+
+
+# System prompts for the final response, built once at import. Only the
+# question is filled in per turn, with str.format; tool results are sent as
+# tool messages.
+RESPONSE_FORMAT = ("First use <Thinking> tags to show your reasoning process, then provide your final answer.\n\n"
+                   "Format:\n"
+                   "<Thinking>\n"
+                   "[{reasoning}]\n"
+                   "</Thinking>\n\n"
+                   "[Your final, concise response to the user]")
+TOOL_REASONING = "Your detailed reasoning about how to interpret the tool results and formulate a response"
+TOOL_RESPONSE_TEMPLATE = ("You are a helpful assistant that demonstrates reasoning with <Thinking> tokens.\n\n"
+                          "The user asked: \"{question}\"\n\n"
+                          "Use the results of the tools you called.\n\n"
+                          + RESPONSE_FORMAT.format(reasoning=TOOL_REASONING))
+DIRECT_RESPONSE_TEMPLATE = ("You are a helpful assistant that demonstrates reasoning with <Thinking> tokens.\n\n"
+                            "The user asked: \"{question}\"\n\n"
+                            + RESPONSE_FORMAT.format(
+                                reasoning="Your detailed reasoning about how to answer this question"))
+
+
+def response_messages(state: AgentState, tool_results: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Build the messages for the final response call.
+    
+    Args:
+        state: The current graph state
+        tool_results: The results of this turn's tool calls, if any
         
-        [Your final, concise response to the user]
-        """
+    Returns:
+        The system message and the user's messages, followed by this turn's
+        tool calls and a tool message with each result
+    """
+    # Ask about the current request; the first message in the history is
+    # only this turn's question on the first turn
+    user_messages = state["user_messages"]
+    tool_calls = state["tool_calls"] if tool_results else []
+    question = user_messages[-1]["content"]
+    
+    if tool_results:
+        # If we used tools, point at their results
+        system_message = TOOL_RESPONSE_TEMPLATE.format(question=question)
     else:
         # For direct responses
-        system_message = f"""You are a helpful assistant that demonstrates reasoning with <Thinking> tokens.
-        
-        The user asked: "{state["history"][0]["content"]}"
-        
-        First use <Thinking> tags to show your reasoning process, then provide your final answer.
-        
-        Format:
-        <Thinking>
-        [Your detailed reasoning about how to answer this question]
-        </Thinking>
-        
-        [Your final, concise response to the user]
-        """
-    
-    messages = [
-        {"role": "system", "content": system_message}
-    ]
-    
-    # Add conversation history (without function messages)
-    user_messages = [msg for msg in state["history"] if msg["role"] == "user"]
-    messages.extend(user_messages)
-    
-    # Get response with thinking tokens
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=messages,
-        temperature=0.7,  # Higher temperature for more creative responses
-    )
-    
-    full_response = response.choices[0].message.content.strip()
-    
+        system_message = DIRECT_RESPONSE_TEMPLATE.format(question=question)
+    
+    # Add conversation history (without function messages), kept up to date
+    # by process_input rather than filtered out of the history every turn
+    messages = [{"role": "system", "content": system_message}, *user_messages]
+    
+    if tool_results:
+        # Answer the tool calls the way the API expects: the assistant message
+        # that made them, then one tool message per call
+        messages.append({"role": "assistant", "content": None, "tool_calls": [
+            {"id": call["id"], "type": "function",
+             "function": {"name": call["name"], "arguments": orjson.dumps(call["args"]).decode()}}
+            for call in tool_calls
+        ]})
+        messages.extend(
+            {"role": "tool", "tool_call_id": call["id"], "content": result}
+            for call, result in zip(tool_calls, tool_results)
+        )
+    
+    return messages
+
+
+def record_response(state: AgentState, full_response: str, shown: bool = False):
+    """
+    Split a response into its thinking and its answer, and store both.
+    """
     # Extract thinking part
-    thinking_match = re.search(r"<Thinking>(.*?)</Thinking>", full_response, re.DOTALL)
-    if thinking_match:
-        thinking = thinking_match.group(1).strip()
-        state["thinking_tokens"].append({
-            "type": "response",
-            "content": thinking
-        })
+    thinking, after_thinking = split_thinking(full_response)
+    if thinking is not None:
+        add_thinking_token(state, "response", thinking, shown=shown)
     
     # Extract the actual response (everything after </Thinking>)
-    response_match = re.search(r"</Thinking>(.*)", full_response, re.DOTALL)
-    if response_match:
-        assistant_message = response_match.group(1).strip()
+    if after_thinking is not None:
+        assistant_message = after_thinking.strip()
     else:
         # Fallback if format not followed
         assistant_message = full_response.replace("<Thinking>", "").replace("</Thinking>", "").strip()
@@ -322,11 +703,34 @@ def thinking_response(state: Dict[str, Any]) -> Dict[str, Any]:
     
     # Add assistant response to history
     state["history"].append({"role": "assistant", "content": assistant_message})
+
+
+async def thinking_response(state: AgentState) -> AgentState:
+    """
+    Generate a final response with DeepSeek-style thinking tokens.
+    """
+    # Include the tool results if we used tools
+    tool_results = None
+    if state["action"] == "use_tool":
+        tool_results = [entry["result"] for entry in state["tool_results"]]
+    messages = response_messages(state, tool_results)
+    
+    # Get response with thinking tokens, printing the thinking as it streams
+    # in if it is shown. The higher temperature gives more creative
+    # responses, so these are never served from the cache.
+    printer = ThinkingPrinter("response") if state["stream_thinking"] else None
+    full_response = (await cached_completion(
+        messages, model="gpt-4", temperature=0.7, on_delta=printer.feed if printer else None
+    ))["content"]
+    if printer:
+        printer.finish()
+    
+    record_response(state, full_response, shown=printer is not None)
     
     return state
 
 
-def router(state: Dict[str, Any]) -> Literal["use_tool", "thinking_response"]:
+def router(state: AgentState) -> Literal["use_tool", "respond_directly"]:
     """
     Determine which node to call next based on the action decision.
     """
@@ -338,7 +742,7 @@ def build_graph() -> StateGraph:
     Build the agent graph with thinking tokens.
     """
     # Create a new graph
-    graph = StateGraph(dict)
+    graph = StateGraph(AgentState)
     
     # Add nodes
     graph.add_node("process_input", process_input)
@@ -369,46 +773,73 @@ def build_graph() -> StateGraph:
     return graph
 
 
-def display_thinking_tokens(tokens, typing_speed=0.02, pause_between_tokens=0.5):
+# Number of characters the typing effect writes at a time
+TYPING_CHUNK = 4
+
+
+def display_thinking_tokens(tokens, typing_speed=0.02, pause_between_tokens=0.5, animate=False):
     """
-    Display thinking tokens with a typing effect.
+    Display thinking tokens, optionally with a typing effect.
+    
+    The typing effect only adds delay, so it is off unless animate is set
+    (run the script with --animate for demos). Without it, the chat shows
+    the thinking live as it streams in instead of calling this afterwards.
     """
+    write, flush = sys.stdout.write, sys.stdout.flush
+    
     for token in tokens:
         # Format based on token type
-        if token["type"] == "decision":
-            print("\n\033[1;36m<Thinking>\033[0m")  # Cyan, bold
-        elif token["type"] == "tool_execution":
-            print("\n\033[1;33m<Thinking>\033[0m")  # Yellow, bold
-        elif token["type"] == "tool_result":
-            print("\n\033[1;32m<Thinking>\033[0m")  # Green, bold
-        elif token["type"] == "response":
-            print("\n\033[1;35m<Thinking>\033[0m")  # Magenta, bold
+        print(THINKING_HEADERS[token.type])
+        
+        # Display the content, with the typing effect a few characters per
+        # write so the terminal isn't flushed once per character
+        content = token.content
+        if animate:
+            for i in range(0, len(content), TYPING_CHUNK):
+                write(content[i:i + TYPING_CHUNK])
+                flush()
+                time.sleep(typing_speed * TYPING_CHUNK)
+        else:
+            write(content)
         
-        # Display the content with typing effect
-        for char in token["content"]:
-            print(char, end="", flush=True)
-            time.sleep(typing_speed)
+        print(THINKING_FOOTER)
+        if animate:
+            time.sleep(pause_between_tokens)
+
+
+async def batch_main(inputs: List[str], concurrency: int = 8) -> List[str]:
+    """
+    Answer many independent requests concurrently, e.g. for offline evaluation.
+    
+    Args:
+        inputs: User messages, each starting its own conversation
+        concurrency: Maximum number of graph runs in flight at once
         
-        print("\n\033[1m</Thinking>\033[0m")  # Bold
-        time.sleep(pause_between_tokens)
+    Returns:
+        The agent responses, in the same order as the inputs
+    """
+    compiled_graph = build_graph().compile()
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_one(user_input: str) -> str:
+        # Each request gets its own, fresh state
+        async with semaphore:
+            result = await compiled_graph.ainvoke(new_state(user_input, [], []))
+        return result["response"]
+    
+    return await asyncio.gather(*(run_one(user_input) for user_input in inputs))
 
 
-def main():
+async def main():
     """Run the LangGraph agent with DeepSeek-style thinking tokens."""
     print("\n--- LangGraph Agent with DeepSeek-style Thinking Tokens ---\n")
     
-    # Check if OpenAI API key is set
-    if not os.getenv("OPENAI_API_KEY"):
-        print("Error: OPENAI_API_KEY not found in environment variables.")
-        print("Please set it in a .env file or export it to your environment.")
-        return
-    
     # Build and compile the graph
     graph = build_graph()
     compiled_graph = graph.compile()
     
     # Initialize conversation history
-    state = {"history": [], "thinking_tokens": []}
+    state = {"history": [], "user_messages": [], "thinking_tokens": []}
     
     # Interactive conversation loop
     print("Chat with the agent. You can ask for calculations, weather, or the current time.")
@@ -416,10 +847,12 @@ def main():
     print("Type 'thinking on' to see the thinking process.")
     print("Type 'thinking off' to hide the thinking process.")
     print("Type 'thinking fast' for faster thinking display.")
-    print("Type 'thinking slow' for slower thinking display.\n")
+    print("Type 'thinking slow' for slower thinking display.")
+    print("(Run with --animate to show the thinking with a typing effect.)\n")
     
     show_thinking = True
     typing_speed = 0.01  # Default speed (seconds per character)
+    animate = "--animate" in sys.argv  # Typing effect for the thinking display
     
     while True:
         # Get user input
@@ -448,23 +881,27 @@ def main():
             print("Thinking display speed decreased for more dramatic effect.")
             continue
             
-        # Prepare state for this turn
-        current_state = state.copy()
-        current_state["input"] = user_input
+        # Prepare state for this turn. The nodes append to the lists in place,
+        # so the turn gets its own copy of the history and fresh thinking
+        # tokens rather than aliasing the lists of earlier turns. The thinking
+        # is shown live as it is generated, unless it is animated afterwards.
+        current_state = new_state(user_input, state["history"], state["user_messages"],
+                                  stream_thinking=show_thinking and not animate)
         
         # Run the graph
-        result = compiled_graph.invoke(current_state)
+        result = await compiled_graph.ainvoke(current_state)
         
         # Update the persistent state with new history
         state["history"] = result["history"]
+        state["user_messages"] = result["user_messages"]
         
-        # Show thinking tokens if enabled
-        if show_thinking:
-            display_thinking_tokens(result["thinking_tokens"], typing_speed)
+        # Show animated thinking tokens if enabled
+        if show_thinking and animate:
+            display_thinking_tokens(result["thinking_tokens"], typing_speed, animate=animate)
         
         # Display the response
         print(f"\nAgent: {result['response']}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
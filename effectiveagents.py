@@ -1,53 +1,126 @@
 import os
+import sys
+import asyncio
 import openai
-import json
-from pydantic import BaseModel, Field
-llm = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Prepare the prompt and messages for the chat completion
-response = llm.chat.completions.create(
-    model="gpt-4",  # You can change this to the desired model like 'gpt-3.5-turbo'
-    messages=[
-        {"role": "system", "content": "You are a helpful assistant."},
-        {"role": "user", "content": "How does Calcium CT score relate to high cholesterol?"},
-    ],
-)
-#print(response.choices[0].message.content.strip())
+from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from batch_api import read_batch_results, submit_batch
+llm = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Maximum number of query rewrites in flight at once, to stay within rate limits
+MAX_CONCURRENCY = 20
 
 class SearchQuery(BaseModel):
     search_query: str = Field(..., description="Query that is optimized for web search.")
     justification: str = Field(..., description="Why this query is relevant to the user's request.")
 
-# Prepare a prompt instructing the assistant to return JSON matching our schema exactly
-structured_prompt = """
-Please provide your answer in JSON format exactly as follows:
-
-{
-  "search_query": "<optimized search query>",
-  "justification": "<explanation of why this query is relevant>"
+# Describe the schema to the model as a function it must call, so the reply
+# arrives as JSON arguments matching SearchQuery instead of free text
+emit_tool = {
+    "type": "function",
+    "function": {
+        "name": "emit",
+        "description": "Return the optimized search query and its justification.",
+        "parameters": SearchQuery.model_json_schema(),
+    },
 }
 
-Question: How does Calcium CT score relate to high cholesterol?
-"""
-
-structured_response = llm.chat.completions.create(
-    model="gpt-4",
-    messages=[
-        {"role": "system", "content": "You are a helpful assistant."},
-        {"role": "user", "content": structured_prompt},
-    ],
-)
-
-# Extract and clean the generated response content
-structured_content = structured_response.choices[0].message.content.strip()
-
-# Attempt to parse the assistant's JSON output and validate it with Pydantic
-try:
-    structured_json = json.loads(structured_content)
-    validated_output = SearchQuery.parse_obj(structured_json)
-    print("Structured Output:")
-    print("Search Query:", validated_output.search_query)
-    print("Justification:", validated_output.justification)
-except Exception as e:
-    print("Error parsing or validating structured output:", e)
-    print("Received response:", structured_content)
\ No newline at end of file
+
+def request_body(question: str) -> dict:
+    """
+    Build the chat completion request that rewrites one question.
+    """
+    return {
+        "model": "gpt-4",
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": question},
+        ],
+        "tools": [emit_tool],
+        "tool_choice": {"type": "function", "function": {"name": "emit"}},
+    }
+
+
+async def rewrite_queries(questions: List[str]) -> List[str]:
+    """
+    Rewrite many questions as search queries concurrently.
+
+    Args:
+        questions: The user questions to rewrite
+
+    Returns:
+        The forced call's JSON arguments for each question, in the same order
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async def rewrite_one(question: str) -> str:
+        async with semaphore:
+            response = await llm.chat.completions.create(**request_body(question))
+        # The forced call's arguments are the structured output
+        return response.choices[0].message.tool_calls[0].function.arguments
+
+    return await asyncio.gather(*(rewrite_one(question) for question in questions))
+
+
+async def rewrite_queries_batch(questions: List[str], path: str = "batch_requests.jsonl") -> List[Optional[str]]:
+    """
+    Rewrite many questions as search queries through the OpenAI Batch API.
+
+    The Batch API is billed at a discount but completes asynchronously
+    (within 24 hours), so this is meant for offline, dataset-sized runs.
+
+    Args:
+        questions: The user questions to rewrite
+        path: Where to write the JSONL request file before uploading it
+
+    Returns:
+        The forced call's JSON arguments for each question, in the same order,
+        or None for a question whose request failed or never ran
+    """
+    batch = await submit_batch(llm, [request_body(question) for question in questions], path)
+
+    # Match the results back to the questions; one failed request doesn't lose the others
+    results = await read_batch_results(llm, batch)
+    arguments = []
+    for i in range(len(questions)):
+        result = results.get(f"request-{i}")
+        if result is None or "error" in result:
+            print(f"Request {i} failed: {result['error'] if result else 'no result was returned'}")
+            arguments.append(None)
+        else:
+            message = result["body"]["choices"][0]["message"]
+            arguments.append(message["tool_calls"][0]["function"]["arguments"])
+    return arguments
+
+
+def print_structured_output(structured_content: str):
+    """
+    Validate one structured output with Pydantic and print it.
+    """
+    try:
+        validated_output = SearchQuery.model_validate_json(structured_content)
+        print("Structured Output:")
+        print("Search Query:", validated_output.search_query)
+        print("Justification:", validated_output.justification)
+    except ValidationError as e:
+        print("Error validating structured output:", e)
+        print("Received response:", structured_content)
+
+
+async def main():
+    # Usage: effectiveagents.py [--batch questions.txt]
+    if len(sys.argv) == 3 and sys.argv[1] == "--batch":
+        with open(sys.argv[2]) as f:
+            questions = [line.strip() for line in f if line.strip()]
+        results = await rewrite_queries_batch(questions)
+    else:
+        questions = ["How does Calcium CT score relate to high cholesterol?"]
+        results = await rewrite_queries(questions)
+
+    for structured_content in results:
+        if structured_content is not None:
+            print_structured_output(structured_content)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
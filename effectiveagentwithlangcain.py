@@ -1,7 +1,5 @@
 import os
-import json
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
+from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 
 #source https://www.youtube.com/watch?v=aHCDrAbH_go&t=668s&ab_channel=LangChain
@@ -11,43 +9,12 @@ class SearchQuery(BaseModel):
     search_query: str = Field(..., description="Query that is optimized for web search.")
     justification: str = Field(..., description="Why this query is relevant to the user's request.")
 
-# Custom wrapper to simulate structured output.
-class StructuredLLM:
-    def __init__(self, llm, schema):
-        self.llm = llm
-        self.schema = schema
-
-    def invoke(self, prompt: str):
-        # Construct a prompt that instructs the assistant to return JSON in a specific format.
-        structured_prompt = f"""
-Please provide your answer in JSON format exactly as follows:
-
-{{
-  "search_query": "<optimized search query>",
-  "justification": "<explanation of why this query is relevant>"
-}}
-
-Question: {prompt}
-"""
-        # Query the LLM using LangChain's predict_messages.
-        response = self.llm.predict_messages([
-            SystemMessage(content="You are a helpful assistant."),
-            HumanMessage(content=structured_prompt)
-        ])
-        response_content = response.content.strip()
-        try:
-            # Attempt to parse the response as JSON.
-            response_json = json.loads(response_content)
-        except Exception as e:
-            raise ValueError(f"Response is not valid JSON: {response_content}") from e
-        # Validate and return the structured output using the Pydantic model.
-        return self.schema.parse_obj(response_json)
-
 # Initialize the LangChain OpenAI Chat model.
-llm = ChatOpenAI(model_name="gpt-4", openai_api_key=os.getenv("OPENAI_API_KEY"))
+llm = ChatOpenAI(model="gpt-4", api_key=os.getenv("OPENAI_API_KEY"))
 
-# Create an instance of the custom structured LLM.
-structured_llm = StructuredLLM(llm, SearchQuery)
+# Augment the LLM with the schema for structured output. This uses function
+# calling under the hood, so the reply arrives already parsed and validated.
+structured_llm = llm.with_structured_output(SearchQuery, method="function_calling")
 
 # Invoke the structured LLM.
 output = structured_llm.invoke("How does Calcium CT score relate to high cholesterol?")
@@ -1,5 +1,5 @@
+import sys
 from langgraph.graph import StateGraph, END
-from langgraph.graph.viz import visualize
 
 # Define a node function that adds both greeting and date
 def hello_world(state):
@@ -21,22 +21,28 @@ builder.add_node("hello", hello_world)
 builder.set_entry_point("hello")
 builder.add_edge("hello", END)
 
-# Before compiling, visualize the graph
-# This function creates a visual representation of your graph
-
-# Method 1: Display the graph directly in a Jupyter notebook
-# If you're running this in a Jupyter notebook, this will render it inline
-# visualize(builder)
-
-# Method 2: Save the visualization to an HTML file
-# This creates an HTML file that you can open in any web browser
-visualize(builder).save("my_graph.html")
-
-# Method 3: Print the graph as a DOT string (Graphviz format)
-# You can use this with Graphviz tools to create custom visualizations
-dot_string = visualize(builder).source
-print("Graph DOT string:")
-print(dot_string)
+# Before compiling, visualize the graph if asked to with --viz
+# This function creates a visual representation of your graph. It is opt-in
+# because rendering it takes far longer than running the graph itself.
+if "--viz" in sys.argv:
+    from langgraph.graph.viz import visualize
+    
+    # Method 1: Display the graph directly in a Jupyter notebook
+    # If you're running this in a Jupyter notebook, this will render it inline
+    # visualize(builder)
+    
+    # Build the visualization once and reuse it for both outputs
+    viz = visualize(builder)
+    
+    # Method 2: Save the visualization to an HTML file
+    # This creates an HTML file that you can open in any web browser
+    viz.save("my_graph.html")
+    
+    # Method 3: Print the graph as a DOT string (Graphviz format)
+    # You can use this with Graphviz tools to create custom visualizations
+    dot_string = viz.source
+    print("Graph DOT string:")
+    print(dot_string)
 
 # Now compile and run the graph as before
 graph = builder.compile()